@@ -0,0 +1,26 @@
+import heapq
+
+
+# Term-at-a-time BM25: every posting of every query term adds its contribution to its document's
+# accumulator, and the k highest scoring documents are taken from the accumulators with a heap and
+# returned best first. In pure Python this measured faster than WAND pruning for the top 1000.
+def bm25_retrieval(query, inverted_index, lexicon, stats, k=1000):
+    scores = {}
+
+    for term in query:
+        if term in lexicon:
+            term_id = lexicon[term]
+            term_postings = inverted_index[term_id]
+            idf = stats.idf[term_id]
+
+            for posting in term_postings:
+                doc_id, term_freq = posting[0], posting[1]
+                K = stats.K[doc_id - 1]
+                score = (term_freq / (K + term_freq)) * idf
+
+                if doc_id in scores:
+                    scores[doc_id] += score
+                else:
+                    scores[doc_id] = score
+
+    return heapq.nlargest(k, scores.items(), key=lambda x: x[1])
@@ -0,0 +1,167 @@
+import re
+import heapq
+from PostingsFile import PostingCursor, open_cursor, END_OF_POSTINGS
+from PositionalIndex import positional_retrieval
+
+# Boolean queries are terms combined with AND, OR, NOT and parentheses, where AND binds tighter
+# than OR and adjacent terms are ANDed, so a plain query "uv damage eyes" is a conjunction.
+# Operators must be written in upper case; anything else is tokenized like the indexed text.
+# On indexes built with --positions, "uv damage" in double quotes matches the exact phrase
+# and "uv damage"~5 matches documents with all its terms within a span of 5 words; on other
+# indexes both match documents containing all the terms.
+OPERATORS = ('AND', 'OR', 'NOT', '(', ')')
+QUERY_TOKEN = re.compile(r'"([^"]*)"(?:~(\d+))?|\(|\)|[^\s()"]+')
+
+
+def tokenize(text):
+    tokens = re.findall(r'\w+', text.lower())
+    return tokens
+
+
+# Parse a query into a tree of ('term', term), ('phrase', (terms, window)), ('and', children),
+# ('or', children) and ('not', child)
+def parse_query(text):
+    tokens = []
+    for match in QUERY_TOKEN.finditer(text):
+        token = match.group()
+        if match.group(1) is not None:
+            window = int(match.group(2)) if match.group(2) is not None else None
+            tokens.append(('phrase', (tuple(tokenize(match.group(1))), window)))
+        elif token in OPERATORS:
+            tokens.append(token)
+        else:
+            tokens.extend(('term', term) for term in tokenize(token))
+
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def parse_or():
+        nonlocal position
+        children = [parse_and()]
+        while peek() == 'OR':
+            position += 1
+            children.append(parse_and())
+        return children[0] if len(children) == 1 else ('or', children)
+
+    def parse_and():
+        nonlocal position
+        children = [parse_factor()]
+        while peek() not in (None, 'OR', ')'):
+            if peek() == 'AND':
+                position += 1
+            children.append(parse_factor())
+        return children[0] if len(children) == 1 else ('and', children)
+
+    def parse_factor():
+        nonlocal position
+        token = peek()
+        position += 1
+        if token == 'NOT':
+            return ('not', parse_factor())
+        if token == '(':
+            node = parse_or()
+            if peek() != ')':
+                raise ValueError(f"Missing ')' in query: {text}")
+            position += 1
+            return node
+        if isinstance(token, tuple):
+            return token
+        raise ValueError(f"Unexpected {token or 'end of query'} in query: {text}")
+
+    if not tokens:
+        return ('and', [])
+    tree = parse_or()
+    if position < len(tokens):
+        raise ValueError(f"Unexpected {tokens[position]} in query: {text}")
+    return tree
+
+
+# Internal ids matching every cursor. The rarest cursor leads and the others seek to its
+# current document, galloping (or skipping whole compressed blocks) past the ids in between,
+# so the work is bounded by the shortest list rather than the longest.
+def intersect(operands):
+    if not operands or any(size == 0 for size, _ in operands):
+        return []
+    cursors = [cursor for _, cursor in sorted(operands, key=lambda operand: operand[0])]
+    lead, others = cursors[0], cursors[1:]
+
+    matches = []
+    while lead.doc_id != END_OF_POSTINGS:
+        candidate = lead.doc_id
+        for cursor in others:
+            cursor.seek(candidate)
+            if cursor.doc_id != candidate:
+                lead.seek(cursor.doc_id)
+                break
+        else:
+            matches.append(candidate)
+            lead.next()
+    return matches
+
+
+# Internal ids matching any cursor
+def union(operands):
+    matches = []
+    for doc_id in heapq.merge(*(iterate(cursor) for _, cursor in operands)):
+        if not matches or matches[-1] != doc_id:
+            matches.append(doc_id)
+    return matches
+
+
+# Internal ids of matches (ascending) that no excluded cursor contains
+def difference(matches, excluded):
+    for _, cursor in excluded:
+        remaining = []
+        for doc_id in matches:
+            cursor.seek(doc_id)
+            if cursor.doc_id != doc_id:
+                remaining.append(doc_id)
+        matches = remaining
+    return matches
+
+
+def iterate(cursor):
+    while cursor.doc_id != END_OF_POSTINGS:
+        yield cursor.doc_id
+        cursor.next()
+
+
+# Evaluate a parsed query to a (size, cursor) operand. Terms missing from the lexicon match nothing.
+def evaluate(node, lexicon, inverted_index, positions=None):
+    kind, value = node
+    if kind == 'term':
+        term_id = lexicon.get(value)
+        term_postings = inverted_index[term_id] if term_id is not None and term_id < len(inverted_index) else []
+        return len(term_postings), open_cursor(term_postings)
+
+    if kind == 'phrase':
+        terms, window = value
+        # Without positions a phrase can only be matched as a conjunction of its terms
+        if positions is None:
+            return evaluate(('and', [('term', term) for term in terms]), lexicon, inverted_index)
+        matches = positional_retrieval(terms, lexicon, inverted_index, positions, window)
+        return len(matches), PostingCursor(matches, None)
+
+    if kind == 'not':
+        raise ValueError("NOT can only exclude documents from terms it is ANDed with")
+
+    if kind == 'or':
+        matches = union([evaluate(child, lexicon, inverted_index, positions) for child in value])
+    else:
+        included = [child for child in value if child[0] != 'not']
+        excluded = [child[1] for child in value if child[0] == 'not']
+        if excluded and not included:
+            raise ValueError("NOT can only exclude documents from terms it is ANDed with")
+        matches = intersect([evaluate(child, lexicon, inverted_index, positions) for child in included])
+        if matches:
+            matches = difference(matches, [evaluate(child, lexicon, inverted_index, positions) for child in excluded])
+    return len(matches), PostingCursor(matches, None)
+
+
+# Internal ids (ascending) of the documents matching a Boolean query. positions is the
+# PositionsFile of the index, needed for phrase and proximity queries.
+def boolean_retrieval(query_text, lexicon, inverted_index, positions=None):
+    _, cursor = evaluate(parse_query(query_text), lexicon, inverted_index, positions)
+    return list(iterate(cursor))
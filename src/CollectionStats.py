@@ -0,0 +1,109 @@
+import os
+import math
+import mmap
+import struct
+from array import array
+from PostingsFile import open_inverted_index
+from Segments import read_segments, segment_directory
+
+# Collection statistics file layout:
+#   header       magic, N, number of terms, total document length, k1, b
+#   doc_lengths  uint32 per internal id (id 1 first), padded to 8 bytes
+#   K            float64 per internal id, k1 * ((1 - b) + b * doc_length / avg_doc_length)
+#   df           uint32 per term id, padded to 8 bytes
+#   idf          float64 per term id, log((N - df + 0.5) / (df + 0.5))
+STATS_FILENAME = "collection_stats.bin"
+STATS_MAGIC = b'CST1'
+HEADER = struct.Struct('<4sIQQdd')
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+
+
+def load_segment_doc_lengths(segment_path):
+    with open(os.path.join(segment_path, "doc-lengths.txt"), "r") as doc_lengths_file:
+        return [int(line.strip()) for line in doc_lengths_file]
+
+
+# Document lengths in internal id order, across all segments of the index
+def load_doc_lengths(index_path):
+    segments = read_segments(index_path)
+    if segments is None:
+        return load_segment_doc_lengths(index_path)
+    doc_lengths = []
+    for segment in segments:
+        doc_lengths.extend(load_segment_doc_lengths(segment_directory(index_path, segment)))
+    return doc_lengths
+
+
+def compute_doc_norms(doc_lengths, avg_doc_length, k1, b):
+    return array('d', (k1 * ((1 - b) + b * doc_length / avg_doc_length) for doc_length in doc_lengths))
+
+
+def compute_idfs(N, df):
+    return array('d', (math.log((N - ni + 0.5) / (ni + 0.5)) for ni in df))
+
+
+class CollectionStats:
+    def __init__(self, N, total_length, k1, b, doc_lengths, K, df, idf):
+        self.N = N
+        self.avg_doc_length = total_length / N if N else 0
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths = doc_lengths
+        self.K = K
+        self.df = df
+        self.idf = idf
+
+
+# Compute the statistics of an index in memory
+def compute_collection_stats(doc_lengths, inverted_index, k1=DEFAULT_K1, b=DEFAULT_B):
+    N = len(doc_lengths)
+    total_length = sum(doc_lengths)
+    df = array('I', (len(term_postings) for term_postings in inverted_index))
+    K = compute_doc_norms(doc_lengths, total_length / N if N else 0, k1, b)
+    return CollectionStats(N, total_length, k1, b, array('I', doc_lengths), K, df, compute_idfs(N, df))
+
+
+# Written to a temporary file and moved into place, so readers that have the old file
+# memory-mapped keep a consistent copy when the statistics of an appended-to index are rebuilt
+def write_collection_stats(index_path, stats):
+    path = os.path.join(index_path, STATS_FILENAME)
+    with open(path + ".tmp", 'wb') as f:
+        f.write(HEADER.pack(STATS_MAGIC, stats.N, len(stats.df), sum(stats.doc_lengths), stats.k1, stats.b))
+        for values in (stats.doc_lengths, stats.K, stats.df, stats.idf):
+            values.tofile(f)
+            f.write(b'\0' * (-f.tell() % 8))
+    os.replace(path + ".tmp", path)
+
+
+# Compute and store the statistics of a freshly built index
+def build_collection_stats(index_path, k1=DEFAULT_K1, b=DEFAULT_B):
+    stats = compute_collection_stats(load_doc_lengths(index_path), open_inverted_index(index_path), k1, b)
+    write_collection_stats(index_path, stats)
+
+
+# Memory-map the stored statistics. K is recomputed if the index was built for another k1 / b,
+# and indexes without a statistics file fall back to doc-lengths.txt and the postings.
+def load_collection_stats(index_path, k1=DEFAULT_K1, b=DEFAULT_B):
+    path = os.path.join(index_path, STATS_FILENAME)
+    if not os.path.exists(path):
+        return compute_collection_stats(load_doc_lengths(index_path), open_inverted_index(index_path), k1, b)
+
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, N, num_terms, total_length, stored_k1, stored_b = HEADER.unpack_from(mm)
+    if magic != STATS_MAGIC:
+        raise ValueError(f"{path} is not a collection statistics file")
+
+    buffer = memoryview(mm)
+    sections = []
+    offset = HEADER.size
+    for fmt, count in (('I', N), ('d', N), ('I', num_terms), ('d', num_terms)):
+        size = struct.calcsize(fmt) * count
+        sections.append(buffer[offset:offset + size].cast(fmt))
+        offset += size + (-size % 8)
+    doc_lengths, K, df, idf = sections
+
+    if (stored_k1, stored_b) != (k1, b):
+        K = compute_doc_norms(doc_lengths, total_length / N if N else 0, k1, b)
+    return CollectionStats(N, total_length, k1, b, doc_lengths, K, df, idf)
@@ -0,0 +1,124 @@
+import os
+import json
+import mmap
+import struct
+from bisect import bisect_left
+from array import array
+from Segments import read_segments, segment_directory, segment_of
+
+# Docno table layout:
+#   header   magic, number of documents, docno width
+#   docnos   fixed-width ASCII docnos (NUL padded) indexed by internal id - 1, padded to 4 bytes
+#   order    uint32 internal ids sorted by docno, binary searched to map a docno to its id
+DOCNOS_FILENAME = "docnos.bin"
+DOCNOS_MAGIC = b'DNO1'
+HEADER = struct.Struct('<4sII')
+
+
+# id_to_docno maps internal ids 1 .. N to docnos
+def write_docno_table(index_path, id_to_docno):
+    docnos = [id_to_docno[internal_id].encode('ascii') for internal_id in range(1, len(id_to_docno) + 1)]
+    width = max(map(len, docnos), default=0)
+    order = array('I', sorted(range(1, len(docnos) + 1), key=lambda internal_id: docnos[internal_id - 1]))
+
+    with open(os.path.join(index_path, DOCNOS_FILENAME), 'wb') as f:
+        f.write(HEADER.pack(DOCNOS_MAGIC, len(docnos), width))
+        f.write(b''.join(docno.ljust(width, b'\0') for docno in docnos))
+        f.write(b'\0' * (-f.tell() % 4))
+        order.tofile(f)
+
+
+class DocnoTable:
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.size, self.width = HEADER.unpack_from(self.mm)
+        if magic != DOCNOS_MAGIC:
+            raise ValueError(f"{filename} is not a docno table")
+
+        order_offset = HEADER.size + self.size * self.width
+        order_offset += -order_offset % 4
+        self.order = memoryview(self.mm)[order_offset:order_offset + 4 * self.size].cast('I')
+
+    def __len__(self):
+        return self.size
+
+    def docno_bytes(self, internal_id):
+        offset = HEADER.size + (internal_id - 1) * self.width
+        return self.mm[offset:offset + self.width]
+
+    # Docno of an internal id, or None if there is no such document
+    def docno(self, internal_id):
+        if not 1 <= internal_id <= self.size:
+            return None
+        return self.docno_bytes(internal_id).rstrip(b'\0').decode('ascii')
+
+    # Internal id of a docno, or None if there is no such document
+    def internal_id(self, docno):
+        key = docno.encode('ascii', 'replace')
+        if len(key) > self.width:
+            return None
+        key = key.ljust(self.width, b'\0')
+        i = bisect_left(self.order, key, key=self.docno_bytes)
+        if i < self.size and self.docno_bytes(self.order[i]) == key:
+            return self.order[i]
+        return None
+
+
+# The same lookups over the id_to_docno.json / docno_to_id.json dicts of indexes without a docno table
+class JsonDocnoTable:
+    def __init__(self, id_to_docno, docno_to_id):
+        self.id_to_docno = id_to_docno
+        self.docno_to_id = docno_to_id
+
+    def __len__(self):
+        return len(self.id_to_docno)
+
+    def docno(self, internal_id):
+        return self.id_to_docno.get(str(internal_id))
+
+    def internal_id(self, docno):
+        return self.docno_to_id.get(docno)
+
+
+# Docno lookups across the segments of an index, each with its own table numbered from 1
+class SegmentedDocnoTable:
+    def __init__(self, first_ids, tables):
+        self.first_ids = first_ids
+        self.tables = tables
+
+    def __len__(self):
+        return sum(map(len, self.tables))
+
+    def docno(self, internal_id):
+        i = segment_of(self.first_ids, internal_id)
+        if i < 0:
+            return None
+        return self.tables[i].docno(internal_id - self.first_ids[i] + 1)
+
+    def internal_id(self, docno):
+        for first_id, table in zip(self.first_ids, self.tables):
+            local_id = table.internal_id(docno)
+            if local_id is not None:
+                return first_id + local_id - 1
+        return None
+
+
+def load_segment_docno_table(segment_path):
+    path = os.path.join(segment_path, DOCNOS_FILENAME)
+    if os.path.exists(path):
+        return DocnoTable(path)
+
+    with open(os.path.join(segment_path, 'id_to_docno.json'), 'r') as f:
+        id_to_docno = json.load(f)
+    with open(os.path.join(segment_path, 'docno_to_id.json'), 'r') as f:
+        docno_to_id = json.load(f)
+    return JsonDocnoTable(id_to_docno, docno_to_id)
+
+
+def load_docno_table(index_path):
+    segments = read_segments(index_path)
+    if segments is None:
+        return load_segment_docno_table(index_path)
+    tables = [load_segment_docno_table(segment_directory(index_path, segment)) for segment in segments]
+    return SegmentedDocnoTable([segment['first_id'] for segment in segments], tables)
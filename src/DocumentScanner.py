@@ -0,0 +1,228 @@
+import re
+import sys
+import gzip
+from html import unescape
+from html.parser import HTMLParser
+
+# Streaming parser for TREC <DOC> collections such as latimes.gz. The decompressed bytes are
+# split in front of every <DOC>, and each piece is cut into tags and the data between them with
+# one regex split. Articles come out with exactly the fields HTMLParser gave when the file was
+# fed to it line by line:
+#   doc_content  all data of the article, character references converted, tags left out
+#   docno        the last line of data inside DOCNO, stripped
+#   headline, text, graphic   every line of data inside the tag, stripped and followed by a space
+# Data after </DOC> still belongs to the article, so an article is complete once the next <DOC>
+# starts. Pieces with anything but plain <TAG> and </TAG> markup (comments, attributes, a lone
+# '<', script or style elements) are handed to HTMLParser itself, line by line as before.
+DOC_START = b'<DOC>'
+READ_SIZE = 1024 * 1024
+SIMPLE_TAG = re.compile(r'<(/?)([a-zA-Z][a-zA-Z0-9]*)>')
+# HTMLParser treats the content of these elements as raw text
+CDATA_START = re.compile('<(?:%s)>' % '|'.join(HTMLParser.CDATA_CONTENT_ELEMENTS), re.IGNORECASE)
+# Checked in this order: data inside DOCNO and HEADLINE only goes to DOCNO, and so on
+FIELD_TAGS = ('docno', 'headline', 'text', 'graphic')
+
+
+# Pieces of the decompressed file, each starting with <DOC> except possibly the first
+def read_pieces(file_path):
+    with gzip.open(file_path, 'rb') as f:
+        buffer = b''
+        for block in iter(lambda: f.read(READ_SIZE), b''):
+            # A <DOC> split over two blocks is found once the second block is appended
+            searched = max(1, len(buffer) - len(DOC_START) + 1)
+            buffer += block
+            start = 0
+            while True:
+                i = buffer.find(DOC_START, max(searched, start + 1))
+                if i < 0:
+                    break
+                yield buffer[start:i]
+                start = i
+            buffer = buffer[start:]
+        if buffer:
+            yield buffer
+
+
+# Decode a piece the way the text-mode reader did, dropping invalid UTF-8 and translating
+# \r\n and \r line endings to \n
+def decode_piece(piece):
+    text = piece.decode('utf-8', errors='ignore')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+# Join the collected parts of an article into its fields
+def finish_article(fields):
+    article = {}
+    for key, value in fields.items():
+        if key == 'doc_content':
+            article[key] = ''.join(value)
+        elif key == 'docno':
+            article[key] = value
+        else:
+            article[key] = ' '.join(value) + ' ' if value else ''
+    return article
+
+
+# Feeds the pieces the fast path cannot handle to HTMLParser, which reports back to the scanner
+class FallbackParser(HTMLParser):
+    def __init__(self, scanner):
+        super().__init__()
+        self.scanner = scanner
+
+    def handle_starttag(self, tag, attrs):
+        self.scanner.start_tag(tag)
+
+    def handle_endtag(self, tag):
+        self.scanner.end_tag(tag)
+
+    def handle_data(self, data):
+        self.scanner.add_chunk(data)
+
+    # Whether the parser is holding back unfinished markup or is inside a script or style element
+    def pending(self):
+        return bool(self.rawdata) or self.cdata_elem is not None
+
+
+class ArticleScanner:
+    def __init__(self):
+        # Which field tags are open, and the first of them in FIELD_TAGS order that data goes to
+        self.open_tags = dict.fromkeys(FIELD_TAGS, False)
+        self.field = None
+
+        # Parts of the current article, lists of strings joined once the article is complete.
+        # Data before the first <DOC> goes to an article that is only kept if a </DOC> ends it.
+        self.fields = {'doc_content': [], 'docno': '', 'headline': [], 'text': [], 'graphic': []}
+        self.finished_fields = None
+        self.articles = []
+        self.parser = FallbackParser(self)
+
+    def start_tag(self, tag):
+        if tag == 'doc':
+            if self.finished_fields is not None:
+                self.articles.append(finish_article(self.finished_fields))
+                self.finished_fields = None
+            self.fields = {'doc_content': []}
+        elif tag in self.open_tags:
+            self.open_tags[tag] = True
+            self.field = next((name for name in FIELD_TAGS if self.open_tags[name]), None)
+
+    def end_tag(self, tag):
+        if tag == 'doc':
+            self.finished_fields = self.fields
+        elif tag in self.open_tags:
+            self.open_tags[tag] = False
+            self.field = next((name for name in FIELD_TAGS if self.open_tags[name]), None)
+
+    # One handle_data call's worth of data from HTMLParser, character references already converted
+    def add_chunk(self, data):
+        self.fields['doc_content'].append(data)
+        if self.field == 'docno':
+            self.fields['docno'] = data.strip()
+        elif self.field is not None:
+            self.fields.setdefault(self.field, []).append(data.strip())
+
+    # All data between two tags. HTMLParser handed it over one line at a time, so each line
+    # counts as a separate chunk.
+    def add_data(self, data):
+        lines = None
+        if '&' in data:
+            lines = [unescape(line) for line in data.split('\n')]
+            data = '\n'.join(lines)
+        self.fields['doc_content'].append(data)
+        if self.field is None:
+            return
+        if lines is None:
+            lines = data.split('\n')
+        if not lines[-1]:
+            lines.pop()
+        if self.field == 'docno':
+            self.fields['docno'] = lines[-1].strip()
+        else:
+            self.fields.setdefault(self.field, []).extend(line.strip() for line in lines)
+
+    # Scan a decoded piece. parts alternates data with the '/' and name of each tag.
+    def feed(self, text):
+        parts = SIMPLE_TAG.split(text)
+        if self.parser.pending() or text.count('<') != len(parts) // 3 or CDATA_START.search(text):
+            self.feed_parser(text)
+            return
+
+        # Tags other than DOC and the field tags, like <P>, only separate data
+        open_tags = self.open_tags
+        for i in range(0, len(parts) - 1, 3):
+            if parts[i]:
+                self.add_data(parts[i])
+            tag = parts[i + 2].lower()
+            if tag == 'doc' or tag in open_tags:
+                if parts[i + 1]:
+                    self.end_tag(tag)
+                else:
+                    self.start_tag(tag)
+        if parts[-1]:
+            self.add_data(parts[-1])
+
+    def feed_parser(self, text):
+        lines = text.split('\n')
+        for line in lines[:-1]:
+            self.parser.feed(line + '\n')
+        if lines[-1]:
+            self.parser.feed(lines[-1])
+
+    # Hand over the completed articles scanned so far
+    def pop_articles(self):
+        articles = self.articles
+        self.articles = []
+        return articles
+
+    def close(self):
+        self.parser.close()
+        if self.finished_fields is not None:
+            self.articles.append(finish_article(self.finished_fields))
+            self.finished_fields = None
+
+
+# Parse a TREC collection like latimes.gz, yielding each article as soon as it is complete
+def read_articles(file_path):
+    scanner = ArticleScanner()
+    for piece in read_pieces(file_path):
+        scanner.feed(decode_piece(piece))
+        yield from scanner.pop_articles()
+    scanner.close()
+    yield from scanner.pop_articles()
+
+
+# The same articles with every line going through HTMLParser, for checking the scanner against
+def read_articles_with_parser(file_path):
+    scanner = ArticleScanner()
+    with gzip.open(file_path, 'rt', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            scanner.parser.feed(line)
+            yield from scanner.pop_articles()
+    scanner.close()
+    yield from scanner.pop_articles()
+
+
+# Check that the scanner extracts the same articles as HTMLParser from the given collections
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python DocumentScanner.py <file.gz> [<file.gz> ...]")
+        sys.exit(1)
+
+    mismatches = 0
+    for file_path in sys.argv[1:]:
+        expected = list(read_articles_with_parser(file_path))
+        actual = list(read_articles(file_path))
+        if len(expected) != len(actual):
+            print(f"{file_path}: HTMLParser found {len(expected)} articles, the scanner {len(actual)}")
+            mismatches += 1
+            continue
+        for number, (a, b) in enumerate(zip(expected, actual), 1):
+            if a != b:
+                fields = [key for key in a.keys() | b.keys() if a.get(key) != b.get(key)]
+                print(f"{file_path}: article {number} ({a.get('docno')}) differs in {', '.join(sorted(fields))}")
+                mismatches += 1
+        print(f"{file_path}: {len(expected)} articles")
+    print(f"{mismatches} mismatches")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,159 @@
+import os
+import json
+import zlib
+import struct
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from Segments import read_segments, segment_directory, segment_of
+
+# Document store layout:
+#   header   magic, number of documents, table offset
+#   records  per internal id, zlib compressed: metadata JSON length (uint32), metadata JSON, raw text
+#   table    per internal id (id 1 first), (byte offset, record length) as 8-byte uints
+DOCUMENTS_FILENAME = "documents.bin"
+DOCUMENTS_MAGIC = b'DOC1'
+HEADER = struct.Struct('<4sQQ')
+METADATA_LENGTH = struct.Struct('<I')
+DEFAULT_FETCH_WORKERS = 8
+
+
+# Appends documents in internal id order to one packed file, writing the offset table on close.
+# The store of a segment starts at the segment's first internal id but numbers its records from 1.
+class DocumentStoreWriter:
+    def __init__(self, filename, compression_level=6, first_id=1):
+        self.file = open(filename, 'wb')
+        self.file.write(HEADER.pack(DOCUMENTS_MAGIC, 0, 0))
+        self.compression_level = compression_level
+        self.first_id = first_id
+        self.table = array('Q')
+
+    def add(self, internal_id, metadata, text):
+        metadata_bytes = json.dumps(metadata).encode('utf-8')
+        record = zlib.compress(METADATA_LENGTH.pack(len(metadata_bytes)) + metadata_bytes + text.encode('utf-8'), self.compression_level)
+        self.add_record(internal_id, record)
+
+    # Add an already compressed record, e.g. one copied from another store
+    def add_record(self, internal_id, record):
+        if internal_id != self.first_id + len(self.table) // 2:
+            raise ValueError(f"Documents must be added in internal id order, got {internal_id}")
+        self.table.append(self.file.tell())
+        self.table.append(len(record))
+        self.file.write(record)
+
+    def close(self):
+        table_offset = self.file.tell()
+        self.table.tofile(self.file)
+        self.file.seek(0)
+        self.file.write(HEADER.pack(DOCUMENTS_MAGIC, len(self.table) // 2, table_offset))
+        self.file.close()
+
+
+def decode_record(record):
+    data = zlib.decompress(record)
+    (metadata_length,) = METADATA_LENGTH.unpack_from(data)
+    metadata_end = METADATA_LENGTH.size + metadata_length
+    return json.loads(data[METADATA_LENGTH.size:metadata_end]), data[metadata_end:].decode('utf-8')
+
+
+# Reads a document with a single pread of its record
+class DocumentStore:
+    def __init__(self, filename):
+        self.fd = os.open(filename, os.O_RDONLY)
+        magic, self.size, table_offset = HEADER.unpack(os.pread(self.fd, HEADER.size, 0))
+        if magic != DOCUMENTS_MAGIC:
+            raise ValueError(f"{filename} is not a document store")
+        self.table = array('Q')
+        self.table.frombytes(os.pread(self.fd, 16 * self.size, table_offset))
+
+    def __len__(self):
+        return self.size
+
+    # Compressed record of an internal id
+    def record(self, internal_id):
+        offset, length = self.table[2 * internal_id - 2], self.table[2 * internal_id - 1]
+        return os.pread(self.fd, length, offset)
+
+    # (metadata, raw text) of an internal id, or None if there is no such document
+    def get(self, internal_id):
+        if not 1 <= internal_id <= self.size:
+            return None
+        return decode_record(self.record(internal_id))
+
+    def close(self):
+        os.close(self.fd)
+
+
+# The same reads over the YYYY/MM/DD per-document files of indexes without a document store
+class DirectoryDocumentStore:
+    def __init__(self, index_path, docno_table):
+        self.index_path = index_path
+        self.docno_table = docno_table
+
+    def __len__(self):
+        return len(self.docno_table)
+
+    def get(self, internal_id):
+        docno = self.docno_table.docno(internal_id)
+        if docno is None:
+            return None
+        dir_path = os.path.join(self.index_path, "19" + docno[6:8], docno[2:4], docno[4:6])
+        metadata_file = os.path.join(dir_path, f"{internal_id:04}_metadata.json")
+        doc_file = os.path.join(dir_path, f"{internal_id:04}.txt")
+        if not os.path.exists(metadata_file) or not os.path.exists(doc_file):
+            return None
+
+        with open(metadata_file, 'r') as f:
+            metadata = json.load(f)
+        with open(doc_file, 'r') as f:
+            return metadata, f.read()
+
+    def close(self):
+        pass
+
+
+# Reads across the segments of an index, each with its own store numbered from 1
+class SegmentedDocumentStore:
+    def __init__(self, first_ids, stores):
+        self.first_ids = first_ids
+        self.stores = stores
+
+    def __len__(self):
+        return sum(map(len, self.stores))
+
+    def get(self, internal_id):
+        i = segment_of(self.first_ids, internal_id)
+        if i < 0:
+            return None
+        return self.stores[i].get(internal_id - self.first_ids[i] + 1)
+
+    def close(self):
+        for store in self.stores:
+            store.close()
+
+
+def open_segment_document_store(segment_path, docno_table):
+    path = os.path.join(segment_path, DOCUMENTS_FILENAME)
+    if os.path.exists(path):
+        return DocumentStore(path)
+    return DirectoryDocumentStore(segment_path, docno_table)
+
+
+# docno_table is the index's own, from load_docno_table
+def open_document_store(index_path, docno_table):
+    segments = read_segments(index_path)
+    if segments is None:
+        return open_segment_document_store(index_path, docno_table)
+    stores = [open_segment_document_store(segment_directory(index_path, segment), table)
+              for segment, table in zip(segments, docno_table.tables)]
+    return SegmentedDocumentStore([segment['first_id'] for segment in segments], stores)
+
+
+# Fetch several documents concurrently on a thread pool, returning (metadata, raw text) or None
+# per internal id in the order given. Long-running callers can pass their own executor to reuse.
+def fetch_documents(documents, internal_ids, executor=None):
+    if len(internal_ids) <= 1:
+        return [documents.get(internal_id) for internal_id in internal_ids]
+    if executor is not None:
+        return list(executor.map(documents.get, internal_ids))
+    with ThreadPoolExecutor(max_workers=min(DEFAULT_FETCH_WORKERS, len(internal_ids))) as executor:
+        return list(executor.map(documents.get, internal_ids))
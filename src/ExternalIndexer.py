@@ -0,0 +1,105 @@
+import os
+import heapq
+import shutil
+from array import array
+from PostingsFile import PostingsWriter
+
+# Rough in-memory cost of one (internal_id, tf) tuple in a posting list, and of one posting list
+BYTES_PER_POSTING = 100
+BYTES_PER_TERM = 120
+DEFAULT_CHECK_INTERVAL = 1000
+
+
+# Read back a run written by RunWriter.flush, yielding (term_id, postings) in term id order
+def read_run(run_path):
+    with open(run_path, 'rb') as f:
+        while True:
+            header = array('I')
+            try:
+                header.fromfile(f, 2)
+            except EOFError:
+                return
+            term_id, count = header
+            postings = array('I')
+            postings.fromfile(f, 2 * count)
+            yield term_id, zip(postings[0::2], postings[1::2])
+
+
+# The postings still in memory, as one more run
+def memory_run(inverted_index, term_id_to_index):
+    for term_id in sorted(term_id_to_index):
+        yield term_id, inverted_index[term_id_to_index[term_id]]
+
+
+# SPIMI-style index construction: once the in-memory inverted index outgrows the memory budget
+# it is written to disk as a run sorted by term id, and the runs are k-way merged at the end.
+# Documents are numbered in order, so concatenating a term's postings run by run keeps them sorted.
+class RunWriter:
+    def __init__(self, output_directory, memory_budget_mb, check_interval=DEFAULT_CHECK_INTERVAL):
+        self.output_directory = output_directory
+        self.run_directory = os.path.join(output_directory, "runs")
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.check_interval = check_interval
+        self.documents_since_check = 0
+        self.run_paths = []
+        os.makedirs(self.run_directory)
+
+    def estimated_size(self, inverted_index):
+        return sum(map(len, inverted_index)) * BYTES_PER_POSTING + len(inverted_index) * BYTES_PER_TERM
+
+    # Called after indexing documents; flushes a run when the in-memory index is over budget
+    def maybe_flush(self, inverted_index, term_id_to_index, doc_lengths, documents=1):
+        self.documents_since_check += documents
+        if self.documents_since_check < self.check_interval:
+            return
+        self.documents_since_check = 0
+        if self.estimated_size(inverted_index) >= self.memory_budget:
+            self.flush(inverted_index, term_id_to_index, doc_lengths)
+
+    def flush(self, inverted_index, term_id_to_index, doc_lengths):
+        run_path = os.path.join(self.run_directory, f"run{len(self.run_paths):04}.bin")
+        with open(run_path, 'wb') as f:
+            for term_id, postings in memory_run(inverted_index, term_id_to_index):
+                data = array('I', (term_id, len(postings)))
+                for internal_id, term_frequency in postings:
+                    data.append(internal_id)
+                    data.append(term_frequency)
+                data.tofile(f)
+        self.run_paths.append(run_path)
+
+        # Document lengths are appended to doc-lengths.txt as well, in internal id order
+        with open(os.path.join(self.output_directory, "doc-lengths.txt"), 'a') as f:
+            for internal_id, length in doc_lengths.items():
+                f.write(f"{length}\n")
+
+        inverted_index.clear()
+        term_id_to_index.clear()
+        doc_lengths.clear()
+
+    # Merge all runs and the remaining in-memory postings into the final postings file
+    def merge(self, postings_path, inverted_index, term_id_to_index, compress, block_size):
+        runs = [read_run(run_path) for run_path in self.run_paths]
+        runs.append(memory_run(inverted_index, term_id_to_index))
+
+        writer = PostingsWriter(postings_path, compress, block_size)
+        current_term_id = None
+        current_postings = []
+        # heapq.merge is stable, so equal term ids come out in run order
+        for term_id, postings in heapq.merge(*runs, key=lambda run_entry: run_entry[0]):
+            if term_id != current_term_id:
+                if current_term_id is not None:
+                    writer.add(current_postings)
+                    current_term_id += 1
+                else:
+                    current_term_id = 0
+                # Term ids missing from every run get an empty posting list
+                while current_term_id < term_id:
+                    writer.add([])
+                    current_term_id += 1
+                current_postings = []
+            current_postings.extend(postings)
+        if current_term_id is not None:
+            writer.add(current_postings)
+        writer.close()
+
+        shutil.rmtree(self.run_directory)
@@ -0,0 +1,192 @@
+import re
+import sys
+import gzip
+from PorterStemmer import PorterStemmer
+
+# The Porter stemmer of PorterStemmer.py, including its departures from the published algorithm,
+# restructured for speed. The consonant / vowel pattern of the word is worked out once, so
+# measure, vowel-in-stem and cvc checks are string operations on the pattern instead of recursive
+# letter-by-letter method calls. A suffix replacement only rewrites the end of the word and of its
+# pattern. Steps 2 to 4 look their suffixes up in tables keyed by the letter they dispatch on.
+
+# Letters to 'c' or 'v' in a single translate for ASCII words; y is resolved afterwards
+ASCII_PATTERN = str.maketrans({chr(i): 'v' if chr(i) in 'aeiou' else 'y' if chr(i) == 'y' else 'c' for i in range(128)})
+CONSONANTS = re.compile('[^aeiouy]')
+VOWEL_PATTERN = str.maketrans('aeiou', 'vvvvv')
+
+# Tried in order; the first suffix the word ends with is the only one considered
+STEP2_SUFFIXES = {
+    'a': (('ational', 'ate'), ('tional', 'tion')),
+    'c': (('enci', 'ence'), ('anci', 'ance')),
+    'e': (('izer', 'ize'),),
+    'l': (('bli', 'ble'), ('alli', 'al'), ('entli', 'ent'), ('eli', 'e'), ('ousli', 'ous')),
+    'o': (('ization', 'ize'), ('ation', 'ate'), ('ator', 'ate')),
+    's': (('alism', 'al'), ('iveness', 'ive'), ('fulness', 'ful'), ('ousness', 'ous')),
+    't': (('aliti', 'al'), ('iviti', 'ive'), ('biliti', 'ble')),
+    'g': (('logi', 'log'),),
+}
+STEP3_SUFFIXES = {
+    'e': (('icate', 'ic'), ('ative', ''), ('alize', 'al')),
+    'i': (('iciti', 'ic'),),
+    'l': (('ical', 'ic'), ('ful', '')),
+    's': (('ness', ''),),
+}
+# Pattern of each replacement; none contain a y, so it does not depend on the letters before
+REPLACEMENT_PATTERNS = {replacement: replacement.translate(ASCII_PATTERN)
+                        for table in (STEP2_SUFFIXES, STEP3_SUFFIXES) for suffixes in table.values()
+                        for _, replacement in suffixes}
+STEP4_SUFFIXES = {
+    'a': ('al',),
+    'c': ('ance', 'ence'),
+    'e': ('er',),
+    'i': ('ic',),
+    'l': ('able', 'ible'),
+    'n': ('ant', 'ement', 'ment', 'ent'),
+    'o': ('ion', 'ou'),
+    's': ('ism',),
+    't': ('ate', 'iti'),
+    'u': ('ous',),
+    'v': ('ive',),
+    'z': ('ize',),
+}
+
+
+# 'c' or 'v' for every letter of b. A y is a consonant at k0 or after a vowel, like PorterStemmer.cons.
+def consonant_pattern(b, k0):
+    if b.isascii():
+        pattern = b.translate(ASCII_PATTERN)
+    else:
+        pattern = CONSONANTS.sub('c', b).translate(VOWEL_PATTERN)
+    if 'y' not in pattern:
+        return pattern
+    pattern = list(pattern)
+    for i in range(len(pattern)):
+        if pattern[i] == 'y':
+            pattern[i] = 'c' if i == k0 or pattern[i - 1] == 'v' else 'v'
+    return ''.join(pattern)
+
+
+# PorterStemmer.stem(b, k0, k) as a single pass over local state. b.endswith(suffix, k0, k + 1)
+# stands in for ends(), j is the end of the stem before a suffix and the measure m() of b[k0 .. j]
+# is pattern.count('vc', k0, j + 1). A suffix replacement sets b[j + 1 ..] like setto(), dropping
+# whatever followed b[k] since it is never looked at again, and appends the replacement's pattern.
+def porter_stem(b, k0, k):
+    if k <= k0 + 1:
+        return b  # --DEPARTURE-- words of one or two letters are left alone
+    pattern = consonant_pattern(b, k0)
+
+    # Step 1ab: plurals and -ed or -ing
+    if b[k] == 's':
+        if b.endswith('sses', k0, k + 1):
+            k -= 2
+        elif b.endswith('ies', k0, k + 1):
+            # -ies to -i leaves the letters up to the i as they are
+            k -= 2
+        elif b[k - 1] != 's':
+            k -= 1
+    last = b[k]
+    if last == 'd' and b.endswith('eed', k0, k + 1):
+        if pattern.count('vc', k0, k - 2) > 0:
+            k -= 1
+    else:
+        if last == 'd' and b.endswith('ed', k0, k + 1):
+            j = k - 2
+        elif last == 'g' and b.endswith('ing', k0, k + 1):
+            j = k - 3
+        else:
+            j = None
+        if j is not None and 'v' in pattern[k0:j + 1]:
+            k = j
+            if b.endswith('at', k0, k + 1) or b.endswith('bl', k0, k + 1) or b.endswith('iz', k0, k + 1):
+                b = b[:k + 1] + 'e'
+                pattern = pattern[:k + 1] + 'v'
+                k += 1
+            elif k >= k0 + 1 and b[k] == b[k - 1] and pattern[k] == 'c':
+                if b[k - 1] not in 'lsz':
+                    k -= 1
+            elif pattern.count('vc', k0, k + 1) == 1 and k >= k0 + 2 and pattern[k - 2:k + 1] == 'cvc' and b[k] not in 'wxy':
+                b = b[:k + 1] + 'e'
+                pattern = pattern[:k + 1] + 'v'
+                k += 1
+
+    # Step 1c: y to i when there is another vowel in the stem
+    if b[k] == 'y' and 'v' in pattern[k0:k]:
+        b = b[:k] + 'i'
+        pattern = pattern[:k] + 'v'
+
+    # Step 2: double suffixes to single ones, when m() > 0
+    for suffix, replacement in STEP2_SUFFIXES.get(b[k - 1], ()):
+        if b.endswith(suffix, k0, k + 1):
+            j = k - len(suffix)
+            if pattern.count('vc', k0, j + 1) > 0:
+                b = b[:j + 1] + replacement
+                pattern = pattern[:j + 1] + REPLACEMENT_PATTERNS[replacement]
+                k = j + len(replacement)
+            break
+
+    # Step 3: -ic-, -full, -ness etc., when m() > 0
+    for suffix, replacement in STEP3_SUFFIXES.get(b[k], ()):
+        if b.endswith(suffix, k0, k + 1):
+            j = k - len(suffix)
+            if pattern.count('vc', k0, j + 1) > 0:
+                b = b[:j + 1] + replacement
+                pattern = pattern[:j + 1] + REPLACEMENT_PATTERNS[replacement]
+                k = j + len(replacement)
+            break
+
+    # Step 4: drop -ant, -ence etc. when m() > 1
+    for suffix in STEP4_SUFFIXES.get(b[k - 1], ()):
+        if b.endswith(suffix, k0, k + 1):
+            j = k - len(suffix)
+            # -ion is only removed after s or t
+            if suffix == 'ion' and b[j] not in 'st':
+                continue
+            if pattern.count('vc', k0, j + 1) > 1:
+                k = j
+            break
+
+    # Step 5: drop a final -e and turn -ll into -l, measuring up to the original last letter j
+    j = k
+    if b[k] == 'e':
+        a = pattern.count('vc', k0, j + 1)
+        if a > 1 or (a == 1 and not (k - 1 >= k0 + 2 and pattern[k - 3:k] == 'cvc' and b[k - 1] not in 'wxy')):
+            k -= 1
+    if b[k] == 'l' and k >= k0 + 1 and b[k - 1] == 'l' and pattern.count('vc', k0, j + 1) > 1:
+        k -= 1
+    return b[k0:k + 1]
+
+
+# Drop-in replacement for PorterStemmer with a batch interface
+class FastPorterStemmer:
+    # Same interface as PorterStemmer.stem: stem p[i] .. p[j], which must be lower case
+    def stem(self, p, i=0, j=None):
+        return porter_stem(p, i, len(p) - 1 if j is None else j)
+
+    def stem_many(self, words):
+        return [porter_stem(word, 0, len(word) - 1) for word in words]
+
+
+# Check that FastPorterStemmer stems every distinct lower-cased word of the given files
+# (plain or gzipped, e.g. latimes.gz) exactly like PorterStemmer
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python FastPorterStemmer.py <file> [<file> ...]")
+        sys.exit(1)
+
+    vocabulary = set()
+    for filename in sys.argv[1:]:
+        opener = gzip.open if filename.endswith('.gz') else open
+        with opener(filename, 'rt', errors='replace') as f:
+            for line in f:
+                vocabulary.update(re.findall(r'\w+', line.lower()))
+
+    words = sorted(vocabulary)
+    reference = PorterStemmer()
+    expected = [reference.stem(word, 0, len(word) - 1) for word in words]
+    actual = FastPorterStemmer().stem_many(words)
+
+    mismatches = [(word, a, b) for word, a, b in zip(words, expected, actual) if a != b]
+    for word, a, b in mismatches[:20]:
+        print(f"{word}: PorterStemmer {a!r}, FastPorterStemmer {b!r}")
+    print(f"{len(words)} words, {len(mismatches)} mismatches")
+    sys.exit(1 if mismatches else 0)
@@ -1,72 +1,73 @@
-import os
 import sys
-import json
+from DocnoTable import load_docno_table
+from DocumentStore import open_document_store, fetch_documents
 
-def get_document(path, search_type, search_value):
+def get_documents(path, search_type, search_values):
     # Load mappings
-    with open(os.path.join(path, 'id_to_docno.json'), 'r') as f:
-        id_to_docno = json.load(f)
-    with open(os.path.join(path, 'docno_to_id.json'), 'r') as f:
-        docno_to_id = json.load(f)
-
-    # Find out search value
-    if search_type == "id":
-        search_value = str(search_value)
-        docno = id_to_docno.get(search_value)
-        if not docno:
-            print("Error: Document with the given ID not found.")
-            return
-    else:
-        docno = search_value
+    docno_table = load_docno_table(path)
+    documents = open_document_store(path, docno_table)
 
-    # Extract year, month, and day from DOCNO
-    year = "19" + docno[6:8]
-    month = docno[2:4]
-    day = docno[4:6]
+    # Find out search values
+    docnos = []
+    for search_value in search_values:
+        if search_type == "id":
+            docnos.append(docno_table.docno(search_value))
+        else:
+            docnos.append(search_value)
 
-    # Construct directory path using year, month, and day
-    dir_path = os.path.join(path, year, month, day)
+    # Fetch the documents and their metadata from the document store concurrently
+    internal_ids = [docno_table.internal_id(docno) if docno else None for docno in docnos]
+    found_ids = [internal_id for internal_id in internal_ids if internal_id is not None]
+    fetched = dict(zip(found_ids, fetch_documents(documents, found_ids)))
 
-    # Construct metadata and document file paths using the id
-    internal_id = docno_to_id.get(docno)
-    metadata_file = os.path.join(dir_path, f"{internal_id:04}_metadata.json")
-    doc_file = os.path.join(dir_path, f"{internal_id:04}.txt")
+    for i, (docno, internal_id) in enumerate(zip(docnos, internal_ids)):
+        if i > 0:
+            print()
+        if not docno:
+            print("Error: Document with the given ID not found.")
+            continue
+        document = fetched.get(internal_id)
+        if document is None:
+            print("Error: Document or metadata not found.")
+            continue
+        metadata, raw_document = document
 
-    if not os.path.exists(metadata_file) or not os.path.exists(doc_file):
-        print("Error: Document or metadata not found.")
-        return
+        # Extract year, month, and day from DOCNO
+        year = "19" + docno[6:8]
+        month = docno[2:4]
+        day = docno[4:6]
 
-    # Fetch and display metadata
-    with open(metadata_file, 'r') as f:
-        metadata = json.load(f)
+        # Display metadata
         print(f"docno: {metadata['docno']}")
-        print(f"internal id: {docno_to_id[docno]}")
+        print(f"internal id: {internal_id}")
         print(f"date: {month}/{day}/{year}")
         print(f"headline: {metadata.get('headline', '')}")
 
-    # Display raw document
-    print("\nraw document:")
-    with open(doc_file, 'r') as f:
-        print(f.read())
+        # Display raw document
+        print("\nraw document:")
+        print(raw_document)
+
+def get_document(path, search_type, search_value):
+    get_documents(path, search_type, [search_value])
 
 if __name__ == "__main__":
 
     # Validate commnad line args
-    if len(sys.argv) != 4:
-        print("Usage: python GetDoc.py <path_to_directory> <'id' or 'docno'> <value>")
+    if len(sys.argv) < 4:
+        print("Usage: python GetDoc.py <path_to_directory> <'id' or 'docno'> <value> [<value> ...]")
         sys.exit(1)
 
-    _, path, search_type, search_value = sys.argv
+    _, path, search_type, *search_values = sys.argv
     if search_type not in ["id", "docno"]:
         print("Error: The third argument must be either 'id' or 'docno'.")
         sys.exit(1)
 
-    # If the search_type is "id", convert the value to an integer
+    # If the search_type is "id", convert the values to integers
     if search_type == "id":
         try:
-            search_value = int(search_value)
+            search_values = [int(search_value) for search_value in search_values]
         except ValueError:
             print("Error: When searching by 'id', the value must be an integer.")
             sys.exit(1)
 
-    get_document(path, search_type, search_value)
+    get_documents(path, search_type, search_values)
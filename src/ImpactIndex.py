@@ -0,0 +1,152 @@
+import os
+import sys
+import mmap
+import heapq
+import struct
+import argparse
+from array import array
+from PostingsFile import open_inverted_index
+from CollectionStats import load_collection_stats, DEFAULT_K1, DEFAULT_B
+from WANDRetrieval import load_upper_bounds, compute_upper_bounds
+from Segments import read_segments
+
+# Impact-ordered index layout:
+#   header     magic, quantization bits, number of terms, directory offset, largest impact, k1, b
+#   segments   per term id, segments in descending impact order, each a uint32 run of
+#              impact, number of documents, internal ids (ascending)
+#   directory  per term id, (byte offset, number of segments) as 8-byte uints
+# A posting's impact is its BM25 contribution scaled to 1 .. 2 ** bits - 1 by the largest
+# contribution in the collection. Terms with a negative IDF only lower scores and are left out.
+IMPACTS_FILENAME = "impacts.bin"
+IMPACTS_MAGIC = b'IMP1'
+HEADER = struct.Struct('<4sIQQddd')
+DEFAULT_BITS = 8
+
+
+def quantize(score, scale):
+    return max(1, round(score * scale))
+
+
+def write_impact_index(index_path, bits=DEFAULT_BITS, k1=DEFAULT_K1, b=DEFAULT_B):
+    inverted_index = open_inverted_index(index_path)
+    stats = load_collection_stats(index_path, k1, b)
+    # The stored upper bounds of an index with appended segments can be loose, so the scale comes
+    # from the actual largest contribution there
+    if read_segments(index_path) is None:
+        upper_bounds = load_upper_bounds(index_path, inverted_index, stats)
+    else:
+        upper_bounds = compute_upper_bounds(inverted_index, stats)
+    max_impact = max(upper_bounds, default=0.0)
+    scale = (2 ** bits - 1) / max_impact if max_impact > 0 else 0.0
+
+    with open(os.path.join(index_path, IMPACTS_FILENAME), 'wb') as f:
+        f.write(HEADER.pack(IMPACTS_MAGIC, bits, 0, 0, max_impact, k1, b))
+        directory = array('Q')
+
+        for term_id, term_postings in enumerate(inverted_index):
+            idf = stats.idf[term_id]
+            segments = {}
+            if idf > 0:
+                for doc_id, term_freq in term_postings:
+                    K = stats.K[doc_id - 1]
+                    impact = quantize((term_freq / (K + term_freq)) * idf, scale)
+                    segments.setdefault(impact, array('I')).append(doc_id)
+
+            directory.append(f.tell())
+            directory.append(len(segments))
+            for impact in sorted(segments, reverse=True):
+                doc_ids = segments[impact]
+                array('I', (impact, len(doc_ids))).tofile(f)
+                doc_ids.tofile(f)
+
+        directory_offset = f.tell()
+        directory.tofile(f)
+        f.seek(0)
+        f.write(HEADER.pack(IMPACTS_MAGIC, bits, len(directory) // 2, directory_offset, max_impact, k1, b))
+
+
+class ImpactIndex:
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.bits, self.num_terms, directory_offset, self.max_impact, self.k1, self.b = HEADER.unpack_from(self.mm)
+        if magic != IMPACTS_MAGIC:
+            raise ValueError(f"{filename} is not an impact-ordered index")
+
+        self.buffer = memoryview(self.mm)
+        self.directory = self.buffer[directory_offset:directory_offset + 16 * self.num_terms].cast('Q')
+        # Multiplying an accumulated impact by this gives an approximate BM25 score
+        self.score_scale = self.max_impact / (2 ** self.bits - 1)
+
+    # (impact, internal ids) segments of a term, highest impact first
+    def segments(self, term_id):
+        offset = self.directory[2 * term_id]
+        segments = []
+        for _ in range(self.directory[2 * term_id + 1]):
+            impact, count = struct.unpack_from('II', self.buffer, offset)
+            offset += 8
+            segments.append((impact, self.buffer[offset:offset + 4 * count].cast('I')))
+            offset += 4 * count
+        return segments
+
+
+def open_impact_index(index_path):
+    return ImpactIndex(os.path.join(index_path, IMPACTS_FILENAME))
+
+
+# Score-at-a-time BM25 over impact-ordered postings. Segments of all query terms are
+# processed in descending impact order, and processing stops once no document outside the
+# current top k can still overtake the k-th one, so the top k set is final. The top k are
+# ranked by the impacts accumulated up to then, scaled back to approximate BM25 scores, so
+# their order is approximate: it can differ from exact BM25 and from their full quantized scores.
+def impact_retrieval(query, impact_index, lexicon, k=1000):
+    segments = []
+    for position, term in enumerate(query):
+        if term in lexicon:
+            for impact, doc_ids in impact_index.segments(lexicon[term]):
+                segments.append((impact, position, doc_ids))
+    segments.sort(key=lambda segment: -segment[0])
+
+    # Highest impact each query term can still add to a document, before and after each segment
+    remaining = {}
+    next_impacts = [0] * len(segments)
+    for i in range(len(segments) - 1, -1, -1):
+        impact, position, _ = segments[i]
+        next_impacts[i] = remaining.get(position, 0)
+        remaining[position] = impact
+
+    accumulators = {}
+    remaining_total = sum(remaining.values())
+    unchecked = 0
+    for i, (impact, position, doc_ids) in enumerate(segments):
+        for doc_id in doc_ids:
+            accumulators[doc_id] = accumulators.get(doc_id, 0) + impact
+        remaining_total += next_impacts[i] - remaining[position]
+        remaining[position] = next_impacts[i]
+
+        # Finding the k-th best accumulator takes a pass over all of them, so it is only done once
+        # as many postings have been added since the last check, keeping the checks' total cost
+        # proportional to the postings processed
+        unchecked += len(doc_ids)
+        if len(accumulators) > k and (unchecked >= len(accumulators) or remaining_total == 0):
+            unchecked = 0
+            best = heapq.nlargest(k + 1, accumulators.values())
+            if best[k - 1] > best[k] + remaining_total:
+                break
+
+    top_k = heapq.nsmallest(k, accumulators.items(), key=lambda entry: (-entry[1], entry[0]))
+    return [(doc_id, score * impact_index.score_scale) for doc_id, score in top_k]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build an impact-ordered index from an existing index directory')
+    parser.add_argument('index_path', help='Path to the index directory')
+    parser.add_argument('--bits', type=int, default=DEFAULT_BITS, help='Bits to quantize impacts to')
+    parser.add_argument('--k1', type=float, default=DEFAULT_K1, help='BM25 k1 parameter')
+    parser.add_argument('--b', type=float, default=DEFAULT_B, help='BM25 b parameter')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.index_path):
+        print("Error: Index directory not found.")
+        sys.exit(1)
+    write_impact_index(args.index_path, args.bits, args.k1, args.b)
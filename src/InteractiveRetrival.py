@@ -2,144 +2,180 @@ import json
 import os
 import time
 import re
-import math
+import threading
 from datetime import datetime
-import nltk
+from PostingsFile import open_inverted_index
+from BM25 import bm25_retrieval
+from CollectionStats import load_collection_stats
+from DocnoTable import load_docno_table
+from DocumentStore import open_document_store, fetch_documents, DEFAULT_FETCH_WORKERS
+from concurrent.futures import ThreadPoolExecutor
+from LRUCache import LRUCache
+from Snippets import sentence_offsets, generate_snippet
+from QueryCache import QueryCache, normalize_query, index_fingerprint, DEFAULT_QUERY_CACHE_BYTES
+
+# Byte budgets of the document and snippet caches of an interactive session
+DOCUMENT_CACHE_BYTES = 64 * 1024 * 1024
+SNIPPET_CACHE_BYTES = 4 * 1024 * 1024
+MAX_RESULTS = 1000
 
 
 def tokenize(text):
     tokens = re.findall(r'\w+', text.lower())
     return tokens
 
-def bm25_retrieval(query, inverted_index, lexicon, doc_lengths, avg_doc_length, N, k1=1.2, b=0.75):
-    scores = {}
+# Property for an index structure of SearchEngine, loaded the first time it is used
+def lazy_component(name):
+    return property(lambda self: self.component(name))
 
-    for term in query:
-        if term in lexicon:
-            term_postings = inverted_index[lexicon[term]]
-            ni = len(term_postings)  # Number of docs containing the term
-
-            for posting in term_postings:
-                doc_id, term_freq = posting[0], posting[1]
-                doc_length = doc_lengths[doc_id - 1] if 1 <= doc_id <= len(doc_lengths) else 0
-
-                K = k1 * ((1 - b) + b * doc_length / avg_doc_length)
-                idf = math.log((N - ni + 0.5) / (ni + 0.5))
-                score = (term_freq / (K + term_freq)) * idf
-
-                if doc_id in scores:
-                    scores[doc_id] += score
-                else:
-                    scores[doc_id] = score
-
-    sorted_scores = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-    return sorted_scores[:1000] 
 
 class SearchEngine:
-    def __init__(self, data_directory):
+    # Index structures and the methods that load them, in the order a first query needs them
+    COMPONENT_LOADERS = {
+        'lexicon': 'load_lexicon',
+        'stats': 'load_collection_stats',
+        'inverted_index': 'load_inverted_index',
+        'query_cache': 'load_query_cache',
+        'docno_table': 'load_mappings',
+        'documents': 'load_document_store',
+    }
+    lexicon = lazy_component('lexicon')
+    stats = lazy_component('stats')
+    inverted_index = lazy_component('inverted_index')
+    query_cache = lazy_component('query_cache')
+    docno_table = lazy_component('docno_table')
+    documents = lazy_component('documents')
+
+    # With lazy set, index structures are only loaded when first used, so the first prompt appears
+    # at once; warm_up then loads them all on a background thread while the user types.
+    def __init__(self, data_directory, document_cache_bytes=DOCUMENT_CACHE_BYTES, snippet_cache_bytes=SNIPPET_CACHE_BYTES,
+                 query_cache_bytes=DEFAULT_QUERY_CACHE_BYTES, query_cache_path=None, lazy=False, warm_up=False):
         self.data_directory = data_directory
-        self.inverted_index = self.load_inverted_index()
-        self.avg_doc_length, self.doc_lengths, self.N = self.load_avg_doc_length()
-        self.lexicon = self.load_lexicon()
-        self.id_to_docno, self.docno_to_id = self.load_mappings()
-        self.full_documents = {}
+        self.query_cache_bytes = query_cache_bytes
+        self.query_cache_path = query_cache_path
+        # Fingerprint of the index files when the engine is created, which cached rankings belong to
+        self.fingerprint = index_fingerprint(data_directory)
+        self.fetch_executor = ThreadPoolExecutor(max_workers=DEFAULT_FETCH_WORKERS)
+        # (metadata, raw text) by internal id, and snippets by (docno, query terms)
+        self.document_cache = LRUCache(document_cache_bytes)
+        self.snippet_cache = LRUCache(snippet_cache_bytes)
+
+        self.components = {}
+        self.load_lock = threading.RLock()
+        if not lazy:
+            self.load_all()
+        elif warm_up:
+            threading.Thread(target=self.load_all, daemon=True).start()
+
+    def component(self, name):
+        if name not in self.components:
+            # One lock for all loads, as components load the ones they depend on
+            with self.load_lock:
+                if name not in self.components:
+                    self.components[name] = getattr(self, self.COMPONENT_LOADERS[name])()
+        return self.components[name]
+
+    def load_all(self):
+        for name in self.COMPONENT_LOADERS:
+            self.component(name)
 
     def load_inverted_index(self):
-        with open(os.path.join(self.data_directory, 'inverted_index.json'), 'r') as f:
-            return json.load(f)
+        return open_inverted_index(self.data_directory)
 
-    def load_avg_doc_length(self):
-        with open(os.path.join(self.data_directory, 'doc-lengths.txt'), 'r') as f:
-            doc_lengths = [int(line.strip()) for line in f]
-            N = len(doc_lengths)
-            avg_doc_length = sum(doc_lengths)/N if N else 0
-            return avg_doc_length, doc_lengths, N
+    def load_collection_stats(self):
+        return load_collection_stats(self.data_directory, k1=1.2, b=0.75)
 
     def load_lexicon(self):
         with open(os.path.join(self.data_directory, 'Lexicon', 'lexicon_term_to_id.json'), 'r') as f:
             return json.load(f)
 
     def load_mappings(self):
-        with open(os.path.join(self.data_directory, 'id_to_docno.json'), 'r') as f:
-            id_to_docno = json.load(f)
-        with open(os.path.join(self.data_directory, 'docno_to_id.json'), 'r') as f:
-            docno_to_id = json.load(f)
-        return id_to_docno, docno_to_id
+        return load_docno_table(self.data_directory)
+
+    def load_document_store(self):
+        return open_document_store(self.data_directory, self.docno_table)
+
+    # Rankings of repeated queries, optionally persisted between sessions
+    def load_query_cache(self):
+        return QueryCache(self.data_directory, self.query_cache_bytes, self.query_cache_path, self.fingerprint)
 
     def prompt_query(self):
         return input("Enter your query (or type 'Q' to quit): ").strip()
 
+    # Top (internal id, BM25 score) pairs for normalized query terms
+    def rank(self, query_terms):
+        return bm25_retrieval(query_terms, self.inverted_index, self.lexicon, self.stats, MAX_RESULTS)
+
     def search(self, query):
-        return bm25_retrieval(tokenize(query), self.inverted_index, self.lexicon,self.doc_lengths, self.avg_doc_length, self.N, k1=1.2, b=0.75)
+        query_terms = normalize_query(tokenize(query))
+        results = self.query_cache.get(query_terms, self.stats.k1, self.stats.b, MAX_RESULTS)
+        if results is None:
+            results = self.rank(query_terms)
+            self.query_cache.put(query_terms, self.stats.k1, self.stats.b, MAX_RESULTS, results)
+        return results
+
+    def close(self):
+        # A query cache that was never loaded has nothing new to save
+        if 'query_cache' in self.components and self.query_cache.cache_path:
+            self.query_cache.save()
+        self.fetch_executor.shutdown()
+
+    # (metadata, raw text) of each internal id, from the cache or fetched concurrently from the document store,
+    # or None for an id the document store has no document for
+    def get_documents(self, doc_ids):
+        documents = [self.document_cache.get(doc_id) for doc_id in doc_ids]
+        missing = [doc_id for doc_id, document in zip(doc_ids, documents) if document is None]
+        if missing:
+            fetched = dict(zip(missing, fetch_documents(self.documents, missing, self.fetch_executor)))
+            for doc_id, document in fetched.items():
+                if document is None:
+                    continue
+                metadata, full_document = document
+                size = len(full_document) + len(metadata.get('headline', '')) + 8 * len(metadata.get('sentences', ()))
+                self.document_cache.put(doc_id, (metadata, full_document), size)
+            documents = [document or fetched[doc_id] for doc_id, document in zip(doc_ids, documents)]
+        return documents
+
+    def get_snippet(self, metadata, full_document, query):
+        docno = metadata['docno']
+        key = (docno, tuple(sorted(set(tokenize(query)))))
+        snippet = self.snippet_cache.get(key)
+        if snippet is None:
+            snippet = self.generate_snippet_from_text(full_document, query, metadata.get('sentences'))
+            self.snippet_cache.put(key, snippet, len(snippet) + len(docno) + sum(map(len, key[1])))
+        return snippet
+
+    # Headline, formatted date and snippet shown for a result
+    def describe_result(self, metadata, full_document, query):
+        date_obj = datetime.strptime(metadata['date'], "%m/%d/%Y")
+        date = f"{date_obj.strftime('%B')} {int(date_obj.strftime('%d'))}, {date_obj.strftime('%Y')}"
+        headline = metadata.get('headline', '')
+
+        snippet = self.get_snippet(metadata, full_document, query)
+
+        # If doc has no headline
+        if not headline:
+            headline = snippet[:50] + '...'
+        return headline, date, snippet
 
     def display_results(self, results, query):
-        # Pull all info about docs to display
-        for rank, (doc_id, _) in enumerate(results[:10], 1):
-            docno = self.id_to_docno[str(doc_id)]
-            year = "19" + docno[6:8]
-            month = docno[2:4]
-            day = docno[4:6]
-
-            dir_path = os.path.join(self.data_directory, year, month, day)
-
-            internal_id = self.docno_to_id[docno]
-            metadata_file = os.path.join(dir_path, f"{internal_id:04}_metadata.json")
-            doc_file = os.path.join(dir_path, f"{internal_id:04}.txt")
-
-            with open(doc_file, 'r') as f:
-                full_document = f.read()
-            self.full_documents[docno] = full_document
-
-            with open(metadata_file, 'r') as f:
-                metadata = json.load(f)
-                docno = metadata['docno']
-                internal_id: self.docno_to_id[docno]
-                date_numerical = f"{month}/{day}/{year}"
-                date_obj = datetime.strptime(date_numerical, "%m/%d/%Y")
-                date = f"{date_obj.strftime('%B')} {int(date_obj.strftime('%d'))}, {date_obj.strftime('%Y')}"
-                headline = metadata.get('headline', '')
-
-            snippet = self.generate_snippet_from_text(full_document, query)
-
-            # If doc has no headline
-            if not headline:
-                headline = snippet[:50] + '...'
-            
+        # Pull all info about docs to display, fetching uncached documents concurrently in rank order
+        documents = self.get_documents([doc_id for doc_id, _ in results[:10]])
+        for rank, document in enumerate(documents, 1):
+            if document is None:
+                print(f"{rank}. Document {results[rank - 1][0]} is missing from the document store\n")
+                continue
+            metadata, full_document = document
+            headline, date, snippet = self.describe_result(metadata, full_document, query)
             print(f"{rank}. {headline} ({date})")
-            print(f"{snippet} ({docno})\n")
-
-
-    def generate_snippet_from_text(self, text, query):
-        query_terms = set(tokenize(query))
-        sentences = nltk.sent_tokenize(text)
-
-        best_snippet = ""
-        best_score = float('-inf')
-
-        metadata_end_identifier = "words"  
-        main_text_started = False
-
-        for sentence in sentences:
-            if metadata_end_identifier in sentence.lower():
-                main_text_started = True
-                continue  # Skip to next sentence after identifying end of metadata
-
-            if not main_text_started or sentence.isupper() or len(sentence.split()) < 4:
-                continue  # Skip metadata, upper case headings, or very short sentences
-
-            sentence_words = set(tokenize(sentence.lower()))
-            common_terms = query_terms.intersection(sentence_words)
-
-            if common_terms:
-                score = len(common_terms) - 0.1 * sentences.index(sentence)
-                if score > best_score:
-                    best_snippet = sentence
-                    best_score = score
-
-        return best_snippet or "No relevant snippet found."
-
+            print(f"{snippet} ({metadata['docno']})\n")
 
 
+    # Sentence offsets are stored with documents at index time; older indexes split sentences here
+    def generate_snippet_from_text(self, text, query, offsets=None):
+        if offsets is None:
+            offsets = sentence_offsets(text)
+        return generate_snippet(text, offsets, set(tokenize(query)))
 
     def run(self):
         while True:
@@ -162,9 +198,11 @@ class SearchEngine:
                     rank = int(user_input)
                     if 1 <= rank <= len(results):
                         doc_id = results[rank - 1][0]
-                        docno = self.id_to_docno[str(doc_id)]
-                        if docno in self.full_documents:
-                            print(self.full_documents[docno])
+                        document = self.get_documents([doc_id])[0]
+                        if document is None:
+                            print(f"Document {doc_id} is missing from the document store.")
+                        else:
+                            print(document[1])
                     else:
                         print("Invalid rank number. Please input rank 1-10.")
                 else:
@@ -174,5 +212,6 @@ class SearchEngine:
 
 if __name__ == "__main__":
     data_directory = "/Users/jackson/Desktop/SearchEngineHW5/data"
-    engine = SearchEngine(data_directory)
+    engine = SearchEngine(data_directory, query_cache_path=os.path.join(data_directory, "query_cache.json"), lazy=True, warm_up=True)
     engine.run()
+    engine.close()
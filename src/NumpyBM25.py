@@ -0,0 +1,46 @@
+import numpy as np
+
+
+# Posting list as an (n, 2) array of (internal_id, tf), without copying binary postings
+def postings_array(term_postings):
+    if hasattr(term_postings, 'view'):
+        return np.frombuffer(term_postings.view, dtype=np.uint32).reshape(-1, 2)
+    # A term's postings across the segments of an index that documents were appended to
+    if getattr(term_postings, 'lists', None):
+        return np.concatenate([postings_array(postings) for postings in term_postings.lists])
+    return np.array(list(term_postings), dtype=np.int64).reshape(-1, 2)
+
+
+# Drop-in replacement for bm25_retrieval that scores whole posting lists with array operations,
+# reading each document's precomputed K straight out of the collection statistics. Scores are the
+# same, but documents with equal scores are ranked by internal id rather than in the order
+# bm25_retrieval first scored them.
+def bm25_retrieval(query, inverted_index, lexicon, stats, k=1000):
+    K_by_doc = np.frombuffer(stats.K, dtype=np.float64)
+    scores = np.zeros(stats.N + 1, dtype=np.float64)
+    touched = np.zeros(stats.N + 1, dtype=bool)
+
+    for term in query:
+        if term in lexicon:
+            term_id = lexicon[term]
+            postings = postings_array(inverted_index[term_id])
+            idf = stats.idf[term_id]
+            doc_ids = postings[:, 0].astype(np.intp)
+            term_freqs = postings[:, 1].astype(np.float64)
+            K = K_by_doc[doc_ids - 1]
+            scores[doc_ids] += (term_freqs / (K + term_freqs)) * idf
+            touched[doc_ids] = True
+
+    candidates = np.flatnonzero(touched)
+    candidate_scores = scores[candidates]
+
+    # Keep the k best with argpartition, breaking ties at the cut-off by internal id
+    if len(candidates) > k:
+        kth_score = candidate_scores[np.argpartition(-candidate_scores, k - 1)[k - 1]]
+        above = candidates[candidate_scores > kth_score]
+        tied = candidates[candidate_scores == kth_score]
+        candidates = np.concatenate((above, tied[:k - len(above)]))
+        candidate_scores = scores[candidates]
+
+    order = np.lexsort((candidates, -candidate_scores))
+    return list(zip(candidates[order].tolist(), candidate_scores[order].tolist()))
@@ -0,0 +1,98 @@
+from array import array
+from collections import deque
+from multiprocessing import Pool
+
+DEFAULT_CHUNK_SIZE = 1000
+INDEXED_FIELDS = ('text', 'headline', 'graphic')
+
+
+# Tokenize a chunk of articles into a partial lexicon and posting runs, plus each posting's
+# token positions when record_positions is set. Terms are listed in order of first occurrence,
+# so merging chunks in document order assigns the same term ids as indexing the articles one by one.
+def index_chunk(task):
+    first_id, articles, tokenize, article_text, record_positions = task
+    local_terms = {}
+    local_postings = []
+    local_positions = [] if record_positions else None
+    lengths = []
+
+    for offset, article in enumerate(articles):
+        tokens = tokenize(article_text(article))
+        lengths.append(len(tokens))
+
+        term_frequencies = {}
+        for token in tokens:
+            term_frequencies[token] = term_frequencies.get(token, 0) + 1
+
+        if record_positions:
+            term_positions = {}
+            for position, token in enumerate(tokens):
+                term_positions.setdefault(token, array('I')).append(position)
+
+        for term, term_frequency in term_frequencies.items():
+            local_id = local_terms.get(term)
+            if local_id is None:
+                local_id = len(local_terms)
+                local_terms[term] = local_id
+                local_postings.append([])
+                if record_positions:
+                    local_positions.append([])
+            local_postings[local_id].append((first_id + offset, term_frequency))
+            if record_positions:
+                local_positions[local_id].append(term_positions[term])
+
+    return list(local_terms), local_postings, lengths, local_positions
+
+
+# Group articles into chunks of consecutive internal ids
+def chunk_articles(articles, chunk_size, first_id=1):
+    chunk = []
+    for article in articles:
+        chunk.append(article)
+        if len(chunk) == chunk_size:
+            yield first_id, chunk
+            first_id += len(chunk)
+            chunk = []
+    if chunk:
+        yield first_id, chunk
+
+
+# Tokenize articles on a process pool, yielding (first_id, articles, partial index) in document order.
+# At most two chunks per worker are in flight so memory stays bounded on large collections.
+def index_in_parallel(articles, tokenize, article_text, workers, chunk_size=DEFAULT_CHUNK_SIZE, record_positions=False, first_id=1):
+    with Pool(workers) as pool:
+        pending = deque()
+        for first_id, chunk in chunk_articles(articles, chunk_size, first_id):
+            # Workers only need the fields that get tokenized
+            fields = [{key: article[key] for key in INDEXED_FIELDS if key in article} for article in chunk]
+            task = (first_id, fields, tokenize, article_text, record_positions)
+            pending.append((first_id, chunk, pool.apply_async(index_chunk, (task,))))
+            if len(pending) >= 2 * workers:
+                first_id, chunk, result = pending.popleft()
+                yield first_id, chunk, result.get()
+        while pending:
+            first_id, chunk, result = pending.popleft()
+            yield first_id, chunk, result.get()
+
+
+# Merge a partial index into the global lexicon, inverted index, document lengths and, if the
+# chunk recorded them, positions
+def merge_partial_index(first_id, partial, lexicon, inverted_index, term_id_to_index, doc_lengths, positions_index=None):
+    terms, postings, lengths, positions = partial
+    for offset, length in enumerate(lengths):
+        doc_lengths[first_id + offset] = length
+
+    for local_id, (term, term_postings) in enumerate(zip(terms, postings)):
+        term_id = lexicon.get_id(term)
+        if term_id in term_id_to_index:
+            index = term_id_to_index[term_id]
+        else:
+            index = len(inverted_index)
+            term_id_to_index[term_id] = index
+            inverted_index.append([])
+            if positions is not None:
+                positions_index.append([])
+
+        inverted_index[index].extend(term_postings)
+        if positions is not None:
+            positions_index[index].extend(positions[local_id])
@@ -1,86 +1,23 @@
 import sys
 import os
+import argparse
 import json
-from html.parser import HTMLParser
-import gzip
 import re
+from array import array
+from contextlib import nullcontext
 from html import unescape
-from PorterStemmer import PorterStemmer
-
-
-class ArticleHandler(HTMLParser):
-    def __init__(self):
-        super().__init__()
-        
-        # Flags to keep track of which tags inside
-        self.in_doc = False
-        self.in_docno = False
-        self.in_headline = False
-        self.in_text = False
-        self.in_graphic = False
-        
-        # Storage for current / all parsed articles
-        self.current_article = {
-            'doc_content': '',
-            'docno': '',
-            'headline': '',
-            'text': '',
-            'graphic': ''
-        }
-        self.articles = []
-
-    # Handle start of an HTML tag
-    def handle_starttag(self, tag, attrs):
-        # Check which tag has been met and update flag
-        if tag == 'doc':
-            self.in_doc = True 
-            self.current_article = {'doc_content': ''}
-        elif tag == 'docno':
-            self.in_docno = True
-        elif tag == 'headline':
-            self.in_headline = True
-        elif tag == 'text':
-            self.in_text = True
-        elif tag == 'graphic':
-            self.in_graphic = True
-
-
-    # Handle end of an HTML tag
-    def handle_endtag(self, tag):
-        # Check which tag has ended and reset correct flag
-        if tag == 'doc':
-            self.in_doc = False
-            self.articles.append(self.current_article)
-        elif tag == 'docno':
-            self.in_docno = False
-        elif tag == 'headline':
-            self.in_headline = False
-        elif tag == 'text':
-            self.in_text = False
-        elif tag == 'graphic':
-            self.in_graphic = False
-
-    # Handle content/data between start and end tags
-    def handle_data(self, data):
-        self.current_article['doc_content'] += data
-        # Append data to current article's content based on current tag
-        if self.in_docno:
-            self.current_article['docno'] = data.strip()
-        elif self.in_headline:
-            self.current_article.setdefault('headline', '')
-            self.current_article['headline'] += data.strip() + " "
-        elif self.in_text:
-            self.current_article.setdefault('text', '')
-            self.current_article['text'] += data.strip() + " "
-        elif self.in_graphic:
-            self.current_article.setdefault('graphic', '')
-            self.current_article['graphic'] += data.strip() + " "
-
-# Read latimes.gz line by line
-def read_gz_file(file_path):
-    with gzip.open(file_path, 'rt', encoding='utf-8', errors='ignore') as f:
-        for line in f:
-            yield line
+from PostingsFile import write_postings, POSTINGS_FILENAME, DEFAULT_BLOCK_SIZE
+from ParallelIndexer import index_in_parallel, merge_partial_index
+from ExternalIndexer import RunWriter
+from WANDRetrieval import build_upper_bounds
+from CollectionStats import build_collection_stats, DEFAULT_K1, DEFAULT_B
+from DocnoTable import write_docno_table
+from DocumentStore import DocumentStoreWriter, DOCUMENTS_FILENAME
+from Snippets import sentence_offsets
+from PositionalIndex import write_positions, POSITIONS_FILENAME
+from DocumentScanner import read_articles
+from SegmentMerger import start_segment, finish_segment, start_background_merge, removing_on_failure
+from StemCache import StemCache
 
 # Dictionaries to map doc numbers to internal IDs and vice-versa, store doc lengths, inverted index
 docno_to_id = {}
@@ -89,6 +26,10 @@ doc_lengths = {}
 inverted_index = []
 term_id_to_index = {}
 
+# Token positions of every posting, parallel to the inverted index, when indexing with --positions
+record_positions = False
+positions_index = []
+
 class Lexicon:
     def __init__(self):
         self.term_to_id = {}
@@ -105,14 +46,23 @@ class Lexicon:
     def get_term(self, term_id):
         return self.id_to_term.get(term_id)
 
-    # Saving Lexicon
+    # Loading the Lexicon of an index to append documents to
+    def load_lexicon_term_to_id(self, filename):
+        with open(filename, 'r') as f:
+            self.term_to_id = json.load(f)
+        self.id_to_term = {term_id: term for term, term_id in self.term_to_id.items()}
+        self.current_id = len(self.term_to_id)
+
+    # Saving Lexicon, replacing any previous file in one step
     def save_lexicon_term_to_id(self, filename):
-        with open(filename, 'w') as f:
+        with open(filename + ".tmp", 'w') as f:
             json.dump(self.term_to_id, f)
+        os.replace(filename + ".tmp", filename)
 
     def save_lexicon_id_to_term(self, filename):
-        with open(filename, 'w') as f:
+        with open(filename + ".tmp", 'w') as f:
             json.dump(self.id_to_term, f)
+        os.replace(filename + ".tmp", filename)
 
 lexicon = Lexicon()
 
@@ -121,13 +71,16 @@ def tokenize(text):
     tokens = re.findall(r'\w+', text.lower())
     return tokens
 
-porter_stemmer = PorterStemmer()
+# Stems are memoized by surface form; with --workers every process keeps its own cache
+stem_cache = StemCache()
 
 # Tokenization and stemming function
-def tokenize_and_stem(text):
+def stem_tokens(text):
     tokens = tokenize(text)
-    stemmed_tokens = [porter_stemmer.stem(token, 0, len(token) - 1) for token in tokens]
-    term_ids = [lexicon.get_id(token) for token in stemmed_tokens]
+    return stem_cache.stem_tokens(tokens)
+
+def tokenize_and_stem(text):
+    term_ids = [lexicon.get_id(token) for token in stem_tokens(text)]
     return term_ids
 
 # Update inverted index function (modified for stemmed tokens)
@@ -136,6 +89,11 @@ def update_index(internal_id, term_ids):
     for term_id in term_ids:
         term_frequencies[term_id] = term_frequencies.get(term_id, 0) + 1
 
+    if record_positions:
+        term_positions = {}
+        for position, term_id in enumerate(term_ids):
+            term_positions.setdefault(term_id, array('I')).append(position)
+
     for term_id, term_frequency in term_frequencies.items():
         if term_id in term_id_to_index:
             index = term_id_to_index[term_id]
@@ -143,102 +101,188 @@ def update_index(internal_id, term_ids):
             index = len(inverted_index)
             term_id_to_index[term_id] = index
             inverted_index.append([])
+            if record_positions:
+                positions_index.append([])
 
         inverted_index[index].append((internal_id, term_frequency))
-
-def save_article_to_directory(article, output_directory, internal_id):
+        if record_positions:
+            positions_index[index].append(term_positions[term_id])
+
+# Posting lists (or positions) in term id order. When appending, terms already in the lexicon can
+# first occur after new ones, and terms missing from the new documents get an empty list.
+def in_term_id_order(index_lists):
+    for term_id in range(lexicon.current_id):
+        yield index_lists[term_id_to_index[term_id]] if term_id in term_id_to_index else []
+
+# Text from TEXT, HEADLINE, GRAPHIC that gets tokenized
+def article_text(article):
+    return unescape(re.sub(r'<.*?>', '', article.get('text', '') + article.get('headline', '') + article.get('graphic', '')))
+
+# Save a parsed article's content and metadata to the document store
+def write_article(article, documents, internal_id):
+    # Extracting date details from the docno
     docno = article['docno']
     year = "19" + docno[6:8]
     month = docno[2:4]
     day = docno[4:6]
     date = f"{month}/{day}/{year}"
 
-    # Creating the directory path
-    dir_path = os.path.join(output_directory, year, month, day)
-    if not os.path.exists(dir_path):
-        os.makedirs(dir_path)
-
-    # Tokenize text from TEXT, HEADLINE, GRAPHIC
-    full_text = unescape(re.sub(r'<.*?>', '', article.get('text', '') + article.get('headline', '') + article.get('graphic', '')))
-    term_ids = tokenize_and_stem(full_text)
-
-    # Saving the article's content to a .txt file
-    doc_path = os.path.join(dir_path, f"{internal_id:04}.txt")
-    with open(doc_path, 'w') as f:
-        f.write(article['doc_content'])
-
-
-    # Saving the article's metadata to a .json file
-    metadata_path = os.path.join(dir_path, f"{internal_id:04}_metadata.json")
+    # Appending the article's content and metadata to the packed document store,
+    # with the sentence boundaries snippets are chosen from
     metadata = {
         'docno': article['docno'],
         'date': date,
-        'headline': article.get('headline', '')
+        'headline': article.get('headline', ''),
+        'sentences': sentence_offsets(article['doc_content']).tolist()
     }
-    with open(metadata_path, 'w') as f:
-        json.dump(metadata, f)
-
-    # Update document length in dictionary
-    doc_lengths[internal_id] = len(term_ids)
+    documents.add(internal_id, metadata, article['doc_content'])
 
     # Updating document number to ID mapping
     docno_to_id[article['docno']] = internal_id
     id_to_docno[internal_id] = article['docno']
 
-    update_index(internal_id, term_ids)
+# Save a parsed article to the document store and add it to the index
+def save_article_to_directory(article, documents, internal_id):
+    # Tokenize text from TEXT, HEADLINE, GRAPHIC
+    term_ids = tokenize_and_stem(article_text(article))
+
+    write_article(article, documents, internal_id)
 
-    return doc_path
+    # Update document length in dictionary
+    doc_lengths[internal_id] = len(term_ids)
+
+    # Update inverted index
+    update_index(internal_id, term_ids)
 
 
 def main():
-    # Ensuring correct number of arguments
-    if len(sys.argv) != 3:
-        print("Usage: python IndexEngine.py <path_to_latimes.gz> <path_to_output_directory>")
-        sys.exit(1)
+    # Command line parsing
+    parser = argparse.ArgumentParser(description='Index the LA Times collection')
+    parser.add_argument('file_path', help='Path to latimes.gz')
+    parser.add_argument('output_directory', help='Directory to write the documents and index to')
+    parser.add_argument('--compress', action='store_true', help='Store postings delta + variable-byte compressed')
+    parser.add_argument('--block-size', type=int, default=DEFAULT_BLOCK_SIZE, help='Postings per skip block when compressing')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes to tokenize with')
+    parser.add_argument('--memory-budget', type=int, help='Megabytes of postings to hold in memory before flushing a run to disk')
+    parser.add_argument('--positions', action='store_true', help='Also store term positions for phrase and proximity queries')
+    parser.add_argument('--k1', type=float, default=DEFAULT_K1, help='BM25 k1 to precompute document normalization for')
+    parser.add_argument('--b', type=float, default=DEFAULT_B, help='BM25 b to precompute document normalization for')
+    parser.add_argument('--upper-bounds', action='store_true', help='Store per-term BM25 upper bounds for BM25Retrieval.py --wand')
+    parser.add_argument('--append', action='store_true', help='Add the documents to the existing index in output_directory as a new segment')
+
+    args = parser.parse_args()
+    if args.memory_budget is not None and args.memory_budget < 1:
+        parser.error("--memory-budget must be at least 1 megabyte")
+    file_path = args.file_path
+    output_directory = args.output_directory
+
+    global record_positions
+    lexicon_directory = os.path.join(output_directory, "Lexicon")
+    if args.append:
+        # New documents continue the existing index's term ids and record positions if it has them
+        if not os.path.exists(os.path.join(lexicon_directory, "lexicon_term_to_id.json")):
+            print("Error: --append needs an existing index in the output directory.")
+            sys.exit(1)
+        lexicon.load_lexicon_term_to_id(os.path.join(lexicon_directory, "lexicon_term_to_id.json"))
+        record_positions = os.path.exists(os.path.join(output_directory, POSITIONS_FILENAME))
+    else:
+        record_positions = args.positions
 
-    file_path = sys.argv[1]
-    output_directory = sys.argv[2]
+    # Positions are held in memory until the end, so they cannot be flushed with runs
+    if record_positions and args.memory_budget is not None:
+        print("Error: --positions cannot be combined with --memory-budget.")
+        sys.exit(1)
 
+    if args.append:
+        # The new segment is written to a staging directory under the index and numbers its
+        # documents after the last internal id of the index
+        try:
+            segment_path, first_id = start_segment(output_directory)
+        except FileExistsError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
     # Check if output directory already exists
-    if os.path.exists(output_directory):
+    elif os.path.exists(output_directory):
         print("Error: Oops! Output directory already exists!")
         sys.exit(1)
     else:
         os.makedirs(output_directory)
+        segment_path, first_id = output_directory, 1
+
+    # A failed append removes its staging directory, so the next append can start over
+    with removing_on_failure(segment_path) if args.append else nullcontext():
+        # Bounded-memory indexing writes sorted runs to disk and merges them at the end
+        run_writer = RunWriter(segment_path, args.memory_budget) if args.memory_budget is not None else None
+
+        # Raw documents and metadata are appended to a single packed file
+        documents = DocumentStoreWriter(os.path.join(segment_path, DOCUMENTS_FILENAME), first_id=first_id)
+
+        if args.workers > 1:
+            # Tokenize on a process pool and merge each chunk's partial index in document order
+            articles = read_articles(file_path)
+            for chunk_first_id, chunk, partial in index_in_parallel(articles, stem_tokens, article_text, args.workers, record_positions=record_positions, first_id=first_id):
+                for offset, article in enumerate(chunk):
+                    write_article(article, documents, chunk_first_id + offset)
+                merge_partial_index(chunk_first_id, partial, lexicon, inverted_index, term_id_to_index, doc_lengths, positions_index)
+                if run_writer:
+                    run_writer.maybe_flush(inverted_index, term_id_to_index, doc_lengths, len(chunk))
+        else:
+            # Stream through latimes.gz, saving and indexing each article as soon as it is parsed
+            internal_id = first_id
+            for article in read_articles(file_path):
+                save_article_to_directory(article, documents, internal_id)
+                internal_id += 1
+                if run_writer:
+                    run_writer.maybe_flush(inverted_index, term_id_to_index, doc_lengths)
+
+        documents.close()
+        if args.append and not id_to_docno:
+            print("Error: no documents to append.")
+            sys.exit(1)
+
+        # Saving document number to ID mappings; a segment's docno table numbers its documents from 1
+        if args.append:
+            write_docno_table(segment_path, {internal_id - first_id + 1: docno for internal_id, docno in id_to_docno.items()})
+        else:
+            with open(os.path.join(output_directory, "docno_to_id.json"), 'w') as f:
+                json.dump(docno_to_id, f)
+            with open(os.path.join(output_directory, "id_to_docno.json"), 'w') as f:
+                json.dump(id_to_docno, f)
+            write_docno_table(output_directory, id_to_docno)
+
+        # Saving document lengths, after any already flushed with a run
+        with open(os.path.join(segment_path, "doc-lengths.txt"), 'a') as f:
+            for internal_id, length in doc_lengths.items():
+                f.write(f"{length}\n")
+
+        # Saving inverted index as binary postings
+        postings_path = os.path.join(segment_path, POSTINGS_FILENAME)
+        if run_writer:
+            run_writer.merge(postings_path, inverted_index, term_id_to_index, args.compress, args.block_size)
+        else:
+            write_postings(postings_path, in_term_id_order(inverted_index), args.compress, args.block_size)
+        if record_positions:
+            write_positions(os.path.join(segment_path, POSITIONS_FILENAME), in_term_id_order(positions_index))
+
+        # Saving collection statistics and, if asked for, each term's largest BM25 contribution for
+        # WAND, which otherwise computes them when it loads the index
+        if args.append:
+            finish_segment(output_directory, segment_path, first_id, len(id_to_docno), args.k1, args.b)
+        else:
+            build_collection_stats(output_directory, args.k1, args.b)
+            if args.upper_bounds:
+                build_upper_bounds(output_directory, args.k1, args.b)
 
-    # HTML parser
-    handler = ArticleHandler()
-
-    for line in read_gz_file(file_path):
-        handler.feed(line)
-
-    # Saving each parsed article to corresponding output_directory
-    internal_id = 1
-    for article in handler.articles:
-        save_article_to_directory(article, output_directory, internal_id)
-        internal_id += 1
-
-    # Saving document number to ID mappings
-    with open(os.path.join(output_directory, "docno_to_id.json"), 'w') as f:
-        json.dump(docno_to_id, f)
-    with open(os.path.join(output_directory, "id_to_docno.json"), 'w') as f:
-        json.dump(id_to_docno, f)
-    
-    # Saving document lengths
-    with open(os.path.join(output_directory, "doc-lengths.txt"), 'w') as f:
-        for internal_id, length in doc_lengths.items():
-            f.write(f"{length}\n")
-
-    # Saving inverted index
-    with open(os.path.join(output_directory, "inverted_index.json"), 'w') as f:
-        json.dump(inverted_index, f)
-    
     # Saving lexicon
-    if not os.path.exists("/Users/jackson/Desktop/SearchEngineHW4/dataHW4/Lexicon"):
-        os.makedirs("/Users/jackson/Desktop/SearchEngineHW4/dataHW4/Lexicon")
+    if not os.path.exists(lexicon_directory):
+        os.makedirs(lexicon_directory)
+
+    lexicon.save_lexicon_term_to_id(os.path.join(lexicon_directory, "lexicon_term_to_id.json"))
+    lexicon.save_lexicon_id_to_term(os.path.join(lexicon_directory, "lexicon_id_to_term.json"))
 
-    lexicon.save_lexicon_term_to_id(os.path.join(output_directory, "Lexicon", "lexicon_term_to_id.json"))
-    lexicon.save_lexicon_id_to_term(os.path.join(output_directory, "Lexicon", "lexicon_id_to_term.json"))
+    # Compact small segments in the background once they pile up
+    if args.append:
+        start_background_merge(output_directory)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,180 @@
+import os
+import mmap
+import heapq
+import struct
+from array import array
+from PostingsFile import open_cursor, vbyte_encode, vbyte_decode, END_OF_POSTINGS
+from Segments import read_segments, segment_directory
+
+# Positions file layout:
+#   header     magic, number of terms, directory offset
+#   positions  per term id, a uint32 byte offset per posting (plus one past the last) into the
+#              term's data, followed by the data: for each posting, in posting list order, the
+#              variable-byte gaps between the token positions of the term in the document
+#   directory  per term id, (byte offset, number of postings) as 8-byte uints
+# Positions count tokens from 0 in the tokenized TEXT, HEADLINE and GRAPHIC of a document.
+POSITIONS_FILENAME = "positions.bin"
+POSITIONS_MAGIC = b'POS1'
+HEADER = struct.Struct('<4sQQ')
+
+
+def write_positions(filename, positions_index):
+    with open(filename, 'wb') as f:
+        f.write(HEADER.pack(POSITIONS_MAGIC, 0, 0))
+        directory = array('Q')
+
+        for term_positions in positions_index:
+            offsets = array('I')
+            data = bytearray()
+            for positions in term_positions:
+                offsets.append(len(data))
+                previous = 0
+                for position in positions:
+                    vbyte_encode(position - previous, data)
+                    previous = position
+            offsets.append(len(data))
+
+            directory.append(f.tell())
+            directory.append(len(term_positions))
+            offsets.tofile(f)
+            f.write(data)
+            # Keep the next term's offsets 4-byte aligned so they can be cast in place
+            f.write(b'\0' * (-f.tell() % 4))
+
+        directory_offset = f.tell()
+        f.write(b'\0' * (-directory_offset % 8))
+        directory_offset += -directory_offset % 8
+        directory.tofile(f)
+        f.seek(0)
+        f.write(HEADER.pack(POSITIONS_MAGIC, len(directory) // 2, directory_offset))
+
+
+class PositionsFile:
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.num_terms, directory_offset = HEADER.unpack_from(self.mm)
+        if magic != POSITIONS_MAGIC:
+            raise ValueError(f"{filename} is not a positions file")
+
+        self.buffer = memoryview(self.mm)
+        self.directory = self.buffer[directory_offset:directory_offset + 16 * self.num_terms].cast('Q')
+
+    # Number of postings of a term, 0 for terms added to the lexicon after this file was written
+    def count(self, term_id):
+        return self.directory[2 * term_id + 1] if term_id < self.num_terms else 0
+
+    # Token positions of a term in the document of its posting_index-th posting
+    def positions(self, term_id, posting_index):
+        offset = self.directory[2 * term_id]
+        count = self.directory[2 * term_id + 1]
+        offsets = self.buffer[offset:offset + 4 * (count + 1)].cast('I')
+        data = self.buffer[offset + 4 * (count + 1):]
+
+        pos = offsets[posting_index]
+        end = offsets[posting_index + 1]
+        positions = []
+        position = 0
+        while pos < end:
+            gap, pos = vbyte_decode(data, pos)
+            position += gap
+            positions.append(position)
+        return positions
+
+
+# Positions across the segments of an index, indexed like the chained posting lists of
+# SegmentedPostings: a term's postings in the first segment that has any, then the next
+class SegmentedPositions:
+    def __init__(self, files):
+        self.files = files
+
+    def positions(self, term_id, posting_index):
+        for positions_file in self.files:
+            count = positions_file.count(term_id)
+            if posting_index < count:
+                return positions_file.positions(term_id, posting_index)
+            posting_index -= count
+        raise IndexError("posting index out of range")
+
+
+# Positions file of an index directory, or None if it was built without --positions
+def open_positions(index_path):
+    segments = read_segments(index_path)
+    paths = [os.path.join(index_path, POSITIONS_FILENAME)] if segments is None else \
+        [os.path.join(segment_directory(index_path, segment), POSITIONS_FILENAME) for segment in segments]
+    if not all(os.path.exists(path) for path in paths):
+        return None
+    if segments is None:
+        return PositionsFile(paths[0])
+    return SegmentedPositions([PositionsFile(path) for path in paths])
+
+
+# Whether the terms occur one after another, given each term's sorted positions in a document.
+# Every list is shifted back by its place in the phrase and merged with the starts still possible.
+def phrase_match(position_lists):
+    starts = position_lists[0]
+    for offset, positions in enumerate(position_lists[1:], 1):
+        remaining = []
+        i = 0
+        for position in positions:
+            start = position - offset
+            while i < len(starts) and starts[i] < start:
+                i += 1
+            if i == len(starts):
+                break
+            if starts[i] == start:
+                remaining.append(start)
+        starts = remaining
+        if not starts:
+            return False
+    return True
+
+
+# Whether one occurrence of every term fits in a span of at most window words. Walks all lists
+# at once, always advancing the smallest position, like finding the smallest range covering k lists.
+def within_match(position_lists, window):
+    heap = [(positions[0], i, 0) for i, positions in enumerate(position_lists)]
+    heapq.heapify(heap)
+    largest = max(position for position, _, _ in heap)
+    while True:
+        smallest, i, j = heap[0]
+        if largest - smallest <= window:
+            return True
+        if j + 1 == len(position_lists[i]):
+            return False
+        position = position_lists[i][j + 1]
+        largest = max(largest, position)
+        heapq.heapreplace(heap, (position, i, j + 1))
+
+
+# Internal ids (ascending) of documents containing the terms as an exact phrase, or with window
+# set, all within a span of window words. Candidate documents come from intersecting the posting
+# lists rarest first; only their positions are decoded.
+def positional_retrieval(terms, lexicon, inverted_index, positions_file, window=None):
+    if not terms:
+        return []
+    term_ids = []
+    for term in terms:
+        term_id = lexicon.get(term)
+        if term_id is None or term_id >= len(inverted_index):
+            return []
+        term_ids.append(term_id)
+
+    cursors = [open_cursor(inverted_index[term_id]) for term_id in term_ids]
+    by_length = sorted(range(len(term_ids)), key=lambda i: len(inverted_index[term_ids[i]]))
+    lead, others = cursors[by_length[0]], [cursors[i] for i in by_length[1:]]
+
+    matches = []
+    while lead.doc_id != END_OF_POSTINGS:
+        candidate = lead.doc_id
+        for cursor in others:
+            cursor.seek(candidate)
+            if cursor.doc_id != candidate:
+                lead.seek(cursor.doc_id)
+                break
+        else:
+            position_lists = [positions_file.positions(term_id, cursor.posting_index()) for term_id, cursor in zip(term_ids, cursors)]
+            if within_match(position_lists, window) if window is not None else phrase_match(position_lists):
+                matches.append(candidate)
+            lead.next()
+    return matches
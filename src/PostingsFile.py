@@ -0,0 +1,397 @@
+import os
+import json
+import mmap
+import struct
+from array import array
+from bisect import bisect_left
+from Segments import read_segments, segment_directory
+
+# Binary postings file layout:
+#   header     magic, codec, skip block size, number of terms, directory offset
+#   postings   per term id, in the format of the codec
+#   directory  per term id, (byte offset, number of postings) as 8-byte uints
+# The header is little-endian. The postings, skip tables and directory are written in native byte
+# order, so the file is meant to be read on the machine that built it.
+#
+# CODEC_RAW stores interleaved (internal_id, term_frequency) pairs as 4-byte uints.
+# CODEC_VBYTE splits a posting list into blocks of block_size postings. A skip table of
+# (last internal_id, byte offset) uint pairs per block is followed by the blocks, where each
+# posting is the variable-byte gap to the previous internal_id followed by the variable-byte tf.
+POSTINGS_MAGIC = b'PST1'
+POSTINGS_FILENAME = "postings.bin"
+CODEC_RAW = 0
+CODEC_VBYTE = 1
+DEFAULT_BLOCK_SIZE = 128
+HEADER = struct.Struct('<4sHHQQ')
+
+# Doc id of a cursor that has run off the end of its posting list
+END_OF_POSTINGS = 2 ** 63
+
+
+# Posting list backed by a slice of the memory-mapped postings file
+class PostingList:
+    def __init__(self, view):
+        self.view = view
+
+    def __len__(self):
+        return len(self.view) // 2
+
+    def __iter__(self):
+        return zip(self.view[0::2], self.view[1::2])
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        return (self.view[2 * i], self.view[2 * i + 1])
+
+    def cursor(self):
+        return PostingCursor(self.view[0::2], self.view[1::2])
+
+
+# Forward-only cursor over parallel doc id / tf sequences
+class PostingCursor:
+    def __init__(self, doc_ids, term_frequencies):
+        self.doc_ids = doc_ids
+        self.term_frequencies = term_frequencies
+        self.size = len(doc_ids)
+        self.position = 0
+        self.doc_id = doc_ids[0] if self.size else END_OF_POSTINGS
+
+    def term_frequency(self):
+        return self.term_frequencies[self.position]
+
+    # Index of the current posting within its posting list
+    def posting_index(self):
+        return self.position
+
+    def next(self):
+        self.position += 1
+        self.doc_id = self.doc_ids[self.position] if self.position < self.size else END_OF_POSTINGS
+
+    # Move to the first posting with doc id >= target. Gallops forward in doubling steps and
+    # binary searches the last step, so short skips stay cheap on long lists.
+    def seek(self, target):
+        if self.doc_id >= target:
+            return
+        low = high = self.position + 1
+        step = 1
+        while high < self.size and self.doc_ids[high] < target:
+            low = high + 1
+            high += step
+            step *= 2
+        self.position = bisect_left(self.doc_ids, target, low, min(high, self.size))
+        self.doc_id = self.doc_ids[self.position] if self.position < self.size else END_OF_POSTINGS
+
+
+# Cursor over a compressed posting list that decodes one block at a time, using the skip table to seek
+class CompressedPostingCursor:
+    def __init__(self, postings):
+        self.postings = postings
+        self.last_doc_ids = postings.block_last_doc_ids()
+        self.load_block(0)
+
+    def load_block(self, block):
+        self.block = block
+        self.position = 0
+        if block >= len(self.last_doc_ids):
+            self.doc_ids = []
+            self.doc_id = END_OF_POSTINGS
+            return
+        decoded = self.postings.decode_block(block)
+        self.doc_ids = [doc_id for doc_id, _ in decoded]
+        self.term_frequencies = [term_frequency for _, term_frequency in decoded]
+        self.doc_id = self.doc_ids[0]
+
+    def term_frequency(self):
+        return self.term_frequencies[self.position]
+
+    def posting_index(self):
+        return self.block * self.postings.block_size + self.position
+
+    def next(self):
+        self.position += 1
+        if self.position < len(self.doc_ids):
+            self.doc_id = self.doc_ids[self.position]
+        else:
+            self.load_block(self.block + 1)
+
+    def seek(self, target):
+        if self.doc_id >= target:
+            return
+        if target > self.last_doc_ids[self.block]:
+            self.load_block(bisect_left(self.last_doc_ids, target, self.block + 1))
+            if self.doc_id >= target:
+                return
+        self.position = bisect_left(self.doc_ids, target, self.position + 1)
+        self.doc_id = self.doc_ids[self.position]
+
+
+# Cursor over any posting list, including the plain lists of inverted_index.json
+def open_cursor(postings):
+    if hasattr(postings, 'cursor'):
+        return postings.cursor()
+    return PostingCursor([posting[0] for posting in postings], [posting[1] for posting in postings])
+
+
+# Variable-byte integer coding, 7 bits per byte with the high bit marking continuation
+def vbyte_encode(number, out):
+    while number >= 0x80:
+        out.append((number & 0x7F) | 0x80)
+        number >>= 7
+    out.append(number)
+
+
+def vbyte_decode(data, pos):
+    number = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        number |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return number, pos
+        shift += 7
+
+
+# Delta + variable-byte compressed posting list with a skip table every block_size postings
+class CompressedPostingList:
+    def __init__(self, buffer, count, block_size):
+        self.count = count
+        self.block_size = block_size
+        num_blocks = (count + block_size - 1) // block_size
+        self.skips = buffer[:8 * num_blocks].cast('I')
+        self.data = buffer[8 * num_blocks:]
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for block in range(len(self.skips) // 2):
+            yield from self.decode_block(block)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError("posting index out of range")
+        return self.decode_block(i // self.block_size)[i % self.block_size]
+
+    # Last internal_id of every block, for choosing a block without decoding
+    def block_last_doc_ids(self):
+        return self.skips[0::2]
+
+    def decode_block(self, block):
+        data = self.data
+        pos = self.skips[2 * block + 1]
+        doc_id = self.skips[2 * block - 2] if block > 0 else 0
+        size = min(self.block_size, self.count - block * self.block_size)
+        postings = []
+        for _ in range(size):
+            gap, pos = vbyte_decode(data, pos)
+            term_frequency, pos = vbyte_decode(data, pos)
+            doc_id += gap
+            postings.append((doc_id, term_frequency))
+        return postings
+
+    def cursor(self):
+        return CompressedPostingCursor(self)
+
+
+# Streams posting lists to disk in term id order
+class PostingsWriter:
+    def __init__(self, filename, compress=False, block_size=DEFAULT_BLOCK_SIZE):
+        self.f = open(filename, 'wb')
+        self.codec = CODEC_VBYTE if compress else CODEC_RAW
+        self.block_size = block_size if compress else 0
+        self.f.write(HEADER.pack(POSTINGS_MAGIC, self.codec, self.block_size, 0, 0))
+        self.directory = array('Q')
+
+    def add(self, postings):
+        if self.codec == CODEC_VBYTE:
+            self.add_compressed(postings)
+            return
+        offset = self.f.tell()
+        data = array('I')
+        for internal_id, term_frequency in postings:
+            data.append(internal_id)
+            data.append(term_frequency)
+        data.tofile(self.f)
+        self.directory.append(offset)
+        self.directory.append(len(data) // 2)
+
+    def add_compressed(self, postings):
+        # Keep the skip table 4-byte aligned so readers can cast it in place
+        offset = self.f.tell()
+        padding = -offset % 4
+        self.f.write(b'\0' * padding)
+        offset += padding
+
+        skips = array('I')
+        data = bytearray()
+        previous = 0
+        count = 0
+        for internal_id, term_frequency in postings:
+            if count % self.block_size == 0:
+                skips.append(0)
+                skips.append(len(data))
+            vbyte_encode(internal_id - previous, data)
+            vbyte_encode(term_frequency, data)
+            previous = internal_id
+            skips[-2] = internal_id
+            count += 1
+
+        skips.tofile(self.f)
+        self.f.write(data)
+        self.directory.append(offset)
+        self.directory.append(count)
+
+    def close(self):
+        directory_offset = self.f.tell()
+        padding = -directory_offset % 8
+        self.f.write(b'\0' * padding)
+        directory_offset += padding
+        self.directory.tofile(self.f)
+        self.f.seek(0)
+        self.f.write(HEADER.pack(POSTINGS_MAGIC, self.codec, self.block_size, len(self.directory) // 2, directory_offset))
+        self.f.close()
+
+
+# Write a whole in-memory inverted index (list indexed by term id)
+def write_postings(filename, inverted_index, compress=False, block_size=DEFAULT_BLOCK_SIZE):
+    writer = PostingsWriter(filename, compress, block_size)
+    for postings in inverted_index:
+        writer.add(postings)
+    writer.close()
+
+
+# Read-only view over postings.bin, indexable by term id like the in-memory inverted index
+class PostingsFile:
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.codec, self.block_size, self.num_terms, directory_offset = HEADER.unpack_from(self.mm)
+        if magic != POSTINGS_MAGIC:
+            raise ValueError(f"{filename} is not a postings file")
+
+        self.buffer = memoryview(self.mm)
+        self.directory_offset = directory_offset
+        self.directory = self.buffer[directory_offset:directory_offset + 16 * self.num_terms].cast('Q')
+
+    def __len__(self):
+        return self.num_terms
+
+    def __getitem__(self, term_id):
+        if not 0 <= term_id < self.num_terms:
+            raise IndexError("term id out of range")
+        offset = self.directory[2 * term_id]
+        count = self.directory[2 * term_id + 1]
+        if self.codec == CODEC_VBYTE:
+            end = self.directory[2 * term_id + 2] if term_id + 1 < self.num_terms else self.directory_offset
+            return CompressedPostingList(self.buffer[offset:end], count, self.block_size)
+        return PostingList(self.buffer[offset:offset + 8 * count].cast('I'))
+
+
+# Cursor over the posting lists of a term in several segments, one after another
+class ChainedCursor:
+    def __init__(self, cursors, sizes):
+        self.cursors = cursors
+        # Index of each list's first posting in the chained list
+        self.offsets = [0]
+        for size in sizes[:-1]:
+            self.offsets.append(self.offsets[-1] + size)
+        self.current = 0
+        self.cursor = cursors[0]
+        self.skip_exhausted()
+
+    # Move on to the next list while the current one has run out
+    def skip_exhausted(self):
+        while self.cursor.doc_id == END_OF_POSTINGS and self.current + 1 < len(self.cursors):
+            self.current += 1
+            self.cursor = self.cursors[self.current]
+        self.doc_id = self.cursor.doc_id
+
+    def term_frequency(self):
+        return self.cursor.term_frequency()
+
+    def posting_index(self):
+        return self.offsets[self.current] + self.cursor.posting_index()
+
+    def next(self):
+        self.cursor.next()
+        self.skip_exhausted()
+
+    def seek(self, target):
+        if self.doc_id >= target:
+            return
+        self.cursor.seek(target)
+        while self.cursor.doc_id == END_OF_POSTINGS and self.current + 1 < len(self.cursors):
+            self.current += 1
+            self.cursor = self.cursors[self.current]
+            self.cursor.seek(target)
+        self.doc_id = self.cursor.doc_id
+
+
+# A term's posting list in an index with several segments: the non-empty lists of the segments
+# in order, which keeps internal ids ascending since each segment covers later ids than the last
+class ChainedPostingList:
+    def __init__(self, lists):
+        self.lists = lists
+
+    def __len__(self):
+        return sum(map(len, self.lists))
+
+    def __iter__(self):
+        for postings in self.lists:
+            yield from postings
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        for postings in self.lists:
+            if 0 <= i < len(postings):
+                return postings[i]
+            i -= len(postings)
+        raise IndexError("posting index out of range")
+
+    def cursor(self):
+        if not self.lists:
+            return PostingCursor([], [])
+        return ChainedCursor([open_cursor(postings) for postings in self.lists], [len(postings) for postings in self.lists])
+
+
+# Indexable by term id like the inverted index of a single segment. Segments written before a term
+# was first seen have no list for it.
+class SegmentedPostings:
+    def __init__(self, segments):
+        self.segments = segments
+        self.num_terms = max(map(len, segments))
+
+    def __len__(self):
+        return self.num_terms
+
+    def __getitem__(self, term_id):
+        if not 0 <= term_id < self.num_terms:
+            raise IndexError("term id out of range")
+        lists = [postings[term_id] for postings in self.segments if term_id < len(postings)]
+        lists = [postings for postings in lists if len(postings)]
+        if len(lists) == 1:
+            return lists[0]
+        return ChainedPostingList(lists)
+
+
+# Open the binary postings of one segment directory, falling back to inverted_index.json for older indexes
+def open_segment_postings(segment_path):
+    postings_path = os.path.join(segment_path, POSTINGS_FILENAME)
+    if os.path.exists(postings_path):
+        return PostingsFile(postings_path)
+    with open(os.path.join(segment_path, "inverted_index.json"), "r") as index_file:
+        return json.load(index_file)
+
+
+# Open the postings of an index directory, across all its segments if documents were appended to it
+def open_inverted_index(index_path):
+    segments = read_segments(index_path)
+    if segments is None:
+        return open_segment_postings(index_path)
+    return SegmentedPostings([open_segment_postings(segment_directory(index_path, segment)) for segment in segments])
@@ -0,0 +1,84 @@
+import os
+import json
+import hashlib
+from LRUCache import LRUCache
+
+# Index files a cached ranking depends on; a change to any of them invalidates the cache
+INDEX_FILES = (
+    "segments.json",
+    "postings.bin",
+    "inverted_index.json",
+    "collection_stats.bin",
+    "doc-lengths.txt",
+    os.path.join("Lexicon", "lexicon_term_to_id.json"),
+)
+DEFAULT_QUERY_CACHE_BYTES = 32 * 1024 * 1024
+# Rough in-memory cost of one (doc_id, score) result
+BYTES_PER_RESULT = 100
+
+
+# Fingerprint of the index files' sizes and modification times
+def index_fingerprint(index_path):
+    signature = []
+    for filename in INDEX_FILES:
+        try:
+            stat = os.stat(os.path.join(index_path, filename))
+            signature.append((filename, stat.st_size, stat.st_mtime_ns))
+        except FileNotFoundError:
+            pass
+    return hashlib.sha1(repr(signature).encode('utf-8')).hexdigest()
+
+
+# Queries that differ only in term order share an entry; callers rank the normalized
+# terms so that a cached ranking is exactly what retrieval would return
+def normalize_query(query_terms):
+    return tuple(sorted(query_terms))
+
+
+# Top-k rankings by (normalized query terms, k1, b, k), evicted least recently used first once
+# they pass the byte budget. Rankings only hold for the index as the engine loaded it, so once the
+# index files change nothing more is cached, looked up or saved.
+class QueryCache:
+    # fingerprint is that of the index the rankings are computed on, by default the index as it is now
+    def __init__(self, index_path, max_bytes=DEFAULT_QUERY_CACHE_BYTES, cache_path=None, fingerprint=None):
+        self.index_path = index_path
+        self.cache_path = cache_path
+        self.results = LRUCache(max_bytes)
+        self.fingerprint = fingerprint or index_fingerprint(index_path)
+        self.stale = False
+        if cache_path and os.path.exists(cache_path):
+            self.load()
+
+    # Whether the index files have changed since the cache was created
+    def index_changed(self):
+        if not self.stale and index_fingerprint(self.index_path) != self.fingerprint:
+            self.stale = True
+            self.results.clear()
+        return self.stale
+
+    def get(self, query_terms, k1, b, k):
+        if self.index_changed():
+            return None
+        return self.results.get((query_terms, k1, b, k))
+
+    def put(self, query_terms, k1, b, k, results):
+        if self.stale:
+            return
+        size = len(results) * BYTES_PER_RESULT + sum(map(len, query_terms))
+        self.results.put((query_terms, k1, b, k), results, size)
+
+    # Rankings are stored least recently used first, so loading them back keeps the LRU order
+    def save(self):
+        if self.index_changed():
+            return
+        entries = [[list(query_terms), k1, b, k, results] for (query_terms, k1, b, k), (results, _) in self.results.entries.items()]
+        with open(self.cache_path, 'w') as f:
+            json.dump({'fingerprint': self.fingerprint, 'entries': entries}, f)
+
+    def load(self):
+        with open(self.cache_path, 'r') as f:
+            cached = json.load(f)
+        if cached.get('fingerprint') != self.fingerprint:
+            return
+        for query_terms, k1, b, k, results in cached['entries']:
+            self.put(tuple(query_terms), k1, b, k, [tuple(result) for result in results])
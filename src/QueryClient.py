@@ -0,0 +1,62 @@
+import sys
+import json
+import socket
+import argparse
+from QueryServer import DEFAULT_HOST, DEFAULT_PORT, DEFAULT_RESULTS
+
+
+# Send one request to a running QueryServer and return its response
+def send_request(request, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    with socket.create_connection((host, port)) as sock:
+        sock.sendall(json.dumps(request).encode() + b'\n')
+        with sock.makefile('rb') as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError("QueryServer closed the connection without answering")
+    return json.loads(line)
+
+
+def main():
+    # Command line parsing
+    parser = argparse.ArgumentParser(description='Query a running QueryServer')
+    parser.add_argument('op', choices=['search', 'boolean', 'document'], help='Kind of request')
+    parser.add_argument('value', help='The query, or the docno of the document to get')
+    parser.add_argument('-k', type=int, default=DEFAULT_RESULTS, help='Number of search results to show')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='Address of the server')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port of the server')
+    args = parser.parse_args()
+
+    if args.op == 'document':
+        request = {'op': 'document', 'docno': args.value}
+    else:
+        request = {'op': args.op, 'query': args.value, 'k': args.k}
+
+    try:
+        response = send_request(request, args.host, args.port)
+    except ConnectionError as e:
+        print(f"Error: could not query the server at {args.host}:{args.port} ({e})")
+        sys.exit(1)
+
+    if 'error' in response:
+        print(f"Error: {response['error']}")
+        sys.exit(1)
+
+    # Print results the way InteractiveRetrieval does
+    if args.op == 'search':
+        for result in response['results']:
+            print(f"{result['rank']}. {result['headline']} ({result['date']})")
+            print(f"{result['snippet']} ({result['docno']})\n")
+    elif args.op == 'boolean':
+        for docno in response['docnos']:
+            print(docno)
+    else:
+        print(f"docno: {response['docno']}")
+        print(f"internal id: {response['internal_id']}")
+        print(f"date: {response['date']}")
+        print(f"headline: {response['headline']}")
+        print("\nraw document:")
+        print(response['text'])
+
+
+if __name__ == "__main__":
+    main()
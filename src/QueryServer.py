@@ -0,0 +1,187 @@
+import os
+import json
+import signal
+import asyncio
+import argparse
+import traceback
+from multiprocessing import get_context
+from concurrent.futures import ThreadPoolExecutor
+from InteractiveRetrival import SearchEngine, tokenize, MAX_RESULTS
+from QueryCache import normalize_query
+from BooleanQuery import boolean_retrieval
+from PositionalIndex import open_positions
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 2
+DEFAULT_RESULTS = 10
+
+# Requests and responses are JSON objects, one per line. A connection may send any number of
+# requests and gets the responses back in the same order.
+#   {"op": "search", "query": "uv damage eyes", "k": 10}
+#       -> {"results": [{"rank", "docno", "score", "headline", "date", "snippet"}, ...]}
+#   {"op": "boolean", "query": "uv AND (damage OR eyes)"} -> {"docnos": [...]}
+#   {"op": "document", "docno": "LA010189-0001"} -> {"docno", "internal_id", "headline", "date", "text"}
+# A request that cannot be answered gets {"error": message}.
+# The index is only read at startup. Once documents are appended to it (or its segments merged)
+# every request gets an error until the server is restarted, instead of results from the old index.
+
+# Loaded once by the server process. The scoring pool is forked afterwards, so its workers
+# inherit the index instead of loading their own.
+engine = None
+positions = None
+
+
+def rank_query(query_terms):
+    return engine.rank(query_terms)
+
+
+def match_boolean(query_text):
+    doc_ids = boolean_retrieval(query_text, engine.lexicon, engine.inverted_index, positions)
+    return [engine.docno_table.docno(doc_id) for doc_id in doc_ids]
+
+
+# Settle an asyncio future from another thread, unless its request has already gone away
+def resolve(loop, future, result=None, error=None):
+    def settle():
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    loop.call_soon_threadsafe(settle)
+
+
+class QueryServer:
+    def __init__(self, pool):
+        self.pool = pool
+        # Scoring runs on the process pool. Fetching documents and making snippets touch the
+        # engine's caches, which are not thread-safe, so that work runs on a single thread.
+        self.engine_executor = ThreadPoolExecutor(max_workers=1)
+
+    # Run function(argument) on the scoring pool without blocking the event loop
+    def score(self, function, argument):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pool.apply_async(function, (argument,),
+                              callback=lambda result: resolve(loop, future, result),
+                              error_callback=lambda error: resolve(loop, future, error=error))
+        return future
+
+    def on_engine(self, function, *args):
+        return asyncio.get_running_loop().run_in_executor(self.engine_executor, function, *args)
+
+    async def search(self, query, k):
+        query_terms = normalize_query(tokenize(query))
+        stats = engine.stats
+        results = engine.query_cache.get(query_terms, stats.k1, stats.b, MAX_RESULTS)
+        if results is None:
+            results = await self.score(rank_query, query_terms)
+            engine.query_cache.put(query_terms, stats.k1, stats.b, MAX_RESULTS, results)
+        return {'results': await self.on_engine(self.describe_results, results[:k], query)}
+
+    def describe_results(self, results, query):
+        documents = engine.get_documents([doc_id for doc_id, _ in results])
+        described = []
+        for rank, ((doc_id, score), document) in enumerate(zip(results, documents), 1):
+            # A document missing from the store is left out, and the others keep their ranks
+            if document is None:
+                print(f"Document {doc_id} is missing from the document store", flush=True)
+                continue
+            metadata, full_document = document
+            headline, date, snippet = engine.describe_result(metadata, full_document, query)
+            described.append({'rank': rank, 'docno': metadata['docno'], 'score': score,
+                              'headline': headline, 'date': date, 'snippet': snippet})
+        return described
+
+    def document(self, docno):
+        internal_id = engine.docno_table.internal_id(docno)
+        if internal_id is None:
+            return {'error': f"Document {docno} not found"}
+        document = engine.get_documents([internal_id])[0]
+        if document is None:
+            return {'error': f"Document {docno} is missing from the document store"}
+        metadata, full_document = document
+        return {'docno': docno, 'internal_id': internal_id, 'headline': metadata.get('headline', ''),
+                'date': metadata.get('date', ''), 'text': full_document}
+
+    async def handle_request(self, line):
+        try:
+            if engine.query_cache.index_changed():
+                return {'error': "The index has changed since the server started; restart the server"}
+            request = json.loads(line)
+            op = request.get('op')
+            if op == 'search':
+                k = int(request.get('k', DEFAULT_RESULTS))
+                if k < 1:
+                    raise ValueError(f"k must be at least 1, got {k}")
+                return await self.search(request['query'], k)
+            if op == 'boolean':
+                return {'docnos': await self.score(match_boolean, request['query'])}
+            if op == 'document':
+                return await self.on_engine(self.document, request['docno'])
+            return {'error': f"Unknown op: {op}"}
+        except KeyError as e:
+            return {'error': f"Missing field {e} in request"}
+        except (ValueError, TypeError, AttributeError) as e:
+            return {'error': str(e)}
+        # Anything else is a bug or a damaged index; report it and keep serving
+        except Exception as e:
+            traceback.print_exc()
+            return {'error': f"Internal error: {e!r}"}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self.handle_request(line)
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Serving {engine.data_directory} on {host}:{port}", flush=True)
+
+        # Serve until interrupted or terminated, then let main shut everything down
+        loop = asyncio.get_running_loop()
+        stopped = loop.create_future()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signal_number, lambda: stopped.done() or stopped.set_result(None))
+        async with server:
+            await stopped
+
+
+def main():
+    global engine, positions
+
+    # Command line parsing
+    parser = argparse.ArgumentParser(description='Serve search, Boolean and document requests from an index kept in memory')
+    parser.add_argument('data_directory', help='Path to the index directory')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='Address to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to listen on')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Number of processes to score queries on')
+    args = parser.parse_args()
+
+    engine = SearchEngine(args.data_directory, query_cache_path=os.path.join(args.data_directory, "query_cache.json"))
+    positions = open_positions(args.data_directory)
+
+    # Fork the scoring workers now that everything they need is loaded
+    pool = get_context('fork').Pool(args.workers)
+    server = QueryServer(pool)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    finally:
+        pool.terminate()
+        server.engine_executor.shutdown()
+        engine.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+import os
+import sys
+import fcntl
+import shutil
+import struct
+import argparse
+import subprocess
+from array import array
+from contextlib import contextmanager
+from Segments import read_segments, write_segments, segment_directory, SEGMENTS_DIRECTORY
+from PostingsFile import open_segment_postings, PostingsWriter, CODEC_VBYTE, DEFAULT_BLOCK_SIZE, POSTINGS_FILENAME
+from CollectionStats import load_segment_doc_lengths, build_collection_stats, load_collection_stats, DEFAULT_K1, DEFAULT_B
+from WANDRetrieval import write_upper_bounds
+from DocnoTable import load_segment_docno_table, write_docno_table
+from DocumentStore import DocumentStore, DocumentStoreWriter, DOCUMENTS_FILENAME
+from PositionalIndex import PositionsFile, write_positions, POSITIONS_FILENAME
+from ImpactIndex import IMPACTS_FILENAME
+
+# Term statistics file layout:
+#   header   magic, number of terms
+#   max_tf   uint32 per term id, the term's largest frequency in any document of the segment
+#   min_len  uint32 per term id, the length of the shortest document of the segment containing the term
+TERM_STATS_FILENAME = "term_stats.bin"
+TERM_STATS_MAGIC = b'TST1'
+TERM_STATS_HEADER = struct.Struct('<4sI')
+NO_LENGTH = 0xFFFFFFFF
+
+# Appends and merges take this lock to update segments.json and the global statistics
+LOCK_FILENAME = "segments.lock"
+# Held by the merge process for a whole merge, so only one merge runs at a time
+MERGE_LOCK_FILENAME = "merge.lock"
+MERGE_LOG_FILENAME = "merge.log"
+# Number of segments of about the same size that get merged into one
+DEFAULT_MERGE_FACTOR = 4
+
+
+@contextmanager
+def segments_lock(index_path):
+    with open(os.path.join(index_path, LOCK_FILENAME), 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+# Yields whether the merge lock was taken; False means another merge is running
+@contextmanager
+def merge_lock(index_path):
+    with open(os.path.join(index_path, MERGE_LOCK_FILENAME), 'w') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+
+
+# Largest tf and shortest document of every term of a segment, from its postings and document lengths
+def compute_term_stats(segment_path, first_id):
+    doc_lengths = load_segment_doc_lengths(segment_path)
+    max_tf = array('I')
+    min_length = array('I')
+    for term_postings in open_segment_postings(segment_path):
+        largest = 0
+        shortest = NO_LENGTH
+        for doc_id, term_freq in term_postings:
+            largest = max(largest, term_freq)
+            shortest = min(shortest, doc_lengths[doc_id - first_id])
+        max_tf.append(largest)
+        min_length.append(shortest)
+    return max_tf, min_length
+
+
+def write_term_stats(segment_path, max_tf, min_length):
+    with open(os.path.join(segment_path, TERM_STATS_FILENAME), 'wb') as f:
+        f.write(TERM_STATS_HEADER.pack(TERM_STATS_MAGIC, len(max_tf)))
+        max_tf.tofile(f)
+        min_length.tofile(f)
+
+
+# Term statistics of a segment, computed and stored first if the segment has none yet
+# (the index directory itself, when documents are first appended to it)
+def load_term_stats(segment_path, first_id):
+    path = os.path.join(segment_path, TERM_STATS_FILENAME)
+    if not os.path.exists(path):
+        write_term_stats(segment_path, *compute_term_stats(segment_path, first_id))
+    with open(path, 'rb') as f:
+        magic, num_terms = TERM_STATS_HEADER.unpack(f.read(TERM_STATS_HEADER.size))
+        if magic != TERM_STATS_MAGIC:
+            raise ValueError(f"{path} is not a term statistics file")
+        max_tf = array('I')
+        min_length = array('I')
+        max_tf.fromfile(f, num_terms)
+        min_length.fromfile(f, num_terms)
+    return max_tf, min_length
+
+
+# BM25 upper bound of every term from the term statistics of the segments. A segment's largest tf
+# paired with its shortest document can only overestimate a term's best score, so WAND still finds
+# the exact top documents, and only the new segment's postings have to be read on an append.
+def segmented_upper_bounds(index_path, segments, stats):
+    ratios = array('d', bytes(8 * len(stats.idf)))
+    for segment in segments:
+        max_tf, min_length = load_term_stats(segment_directory(index_path, segment), segment['first_id'])
+        for term_id, term_freq in enumerate(max_tf):
+            if term_freq:
+                K = stats.k1 * ((1 - stats.b) + stats.b * min_length[term_id] / stats.avg_doc_length)
+                ratios[term_id] = max(ratios[term_id], term_freq / (K + term_freq))
+    return array('d', (max(0.0, ratio * idf) for ratio, idf in zip(ratios, stats.idf)))
+
+
+# Directory to index a batch of documents into before appending it to an index, and the internal
+# id of its first document. The index is turned into a one-segment index on its first append.
+def start_segment(index_path):
+    with segments_lock(index_path):
+        segments = read_segments(index_path)
+        if segments is None:
+            segments = [{'path': '.', 'first_id': 1, 'documents': len(load_segment_doc_lengths(index_path))}]
+            write_segments(index_path, segments)
+    first_id = segments[-1]['first_id'] + segments[-1]['documents']
+
+    staging_path = os.path.join(index_path, SEGMENTS_DIRECTORY, f"new-{first_id}")
+    if os.path.exists(staging_path):
+        raise FileExistsError(f"{staging_path} already exists: another append is running or was interrupted")
+    os.makedirs(staging_path)
+    return staging_path, first_id
+
+
+# Remove a segment's staging directory if building it fails or is interrupted
+@contextmanager
+def removing_on_failure(staging_path):
+    try:
+        yield
+    except BaseException:
+        if os.path.exists(staging_path):
+            shutil.rmtree(staging_path)
+        raise
+
+
+# Add a fully written segment to the index and update the statistics of the whole collection
+def finish_segment(index_path, staging_path, first_id, documents, k1=DEFAULT_K1, b=DEFAULT_B):
+    write_term_stats(staging_path, *compute_term_stats(staging_path, first_id))
+    name = f"seg-{first_id}-{first_id + documents - 1}"
+    os.rename(staging_path, os.path.join(index_path, SEGMENTS_DIRECTORY, name))
+
+    with segments_lock(index_path):
+        segments = read_segments(index_path)
+        segments.append({'path': os.path.join(SEGMENTS_DIRECTORY, name), 'first_id': first_id, 'documents': documents})
+        write_segments(index_path, segments)
+
+        build_collection_stats(index_path, k1, b)
+        write_upper_bounds(index_path, segmented_upper_bounds(index_path, segments, load_collection_stats(index_path, k1, b)), k1, b)
+
+    # The impact-ordered index only covers the documents it was built from
+    if os.path.exists(os.path.join(index_path, IMPACTS_FILENAME)):
+        os.remove(os.path.join(index_path, IMPACTS_FILENAME))
+        print(f"Removed {IMPACTS_FILENAME}, which does not cover the appended documents; rerun ImpactIndex.py to rebuild it.")
+
+
+# Segments are grouped in levels by size, level L holding those with fewer than merge_factor ** (L + 1) documents
+def segment_level(documents, merge_factor):
+    level = 0
+    while documents >= merge_factor ** (level + 1):
+        level += 1
+    return level
+
+
+# The first run of merge_factor consecutive appended segments on the same level, or None. Merging
+# them moves the result up a level, so every document is rewritten only a logarithmic number of
+# times. The index directory's own segment is never merged.
+def choose_merge(segments, merge_factor=DEFAULT_MERGE_FACTOR):
+    appended = segments[1:]
+    for start in range(len(appended) - merge_factor + 1):
+        window = appended[start:start + merge_factor]
+        if len({segment_level(segment['documents'], merge_factor) for segment in window}) == 1:
+            return window
+    return None
+
+
+# Write the segments' postings, positions, document lengths, term statistics, docnos and documents,
+# one after another, as a single segment in output_path
+def write_merged_segment(index_path, window, output_path):
+    paths = [segment_directory(index_path, segment) for segment in window]
+    os.makedirs(output_path)
+
+    postings = [open_segment_postings(path) for path in paths]
+    num_terms = max(map(len, postings))
+    writer = PostingsWriter(os.path.join(output_path, POSTINGS_FILENAME), postings[0].codec == CODEC_VBYTE,
+                            postings[0].block_size or DEFAULT_BLOCK_SIZE)
+    for term_id in range(num_terms):
+        writer.add(posting for segment_postings in postings if term_id < len(segment_postings)
+                   for posting in segment_postings[term_id])
+    writer.close()
+
+    if all(os.path.exists(os.path.join(path, POSITIONS_FILENAME)) for path in paths):
+        files = [PositionsFile(os.path.join(path, POSITIONS_FILENAME)) for path in paths]
+        write_positions(os.path.join(output_path, POSITIONS_FILENAME),
+                        ([positions_file.positions(term_id, i) for positions_file in files for i in range(positions_file.count(term_id))]
+                         for term_id in range(num_terms)))
+
+    with open(os.path.join(output_path, "doc-lengths.txt"), 'w') as f:
+        for path in paths:
+            f.writelines(f"{length}\n" for length in load_segment_doc_lengths(path))
+
+    max_tf = array('I', bytes(4 * num_terms))
+    min_length = array('I', [NO_LENGTH]) * num_terms
+    for path, segment in zip(paths, window):
+        segment_max_tf, segment_min_length = load_term_stats(path, segment['first_id'])
+        for term_id in range(len(segment_max_tf)):
+            max_tf[term_id] = max(max_tf[term_id], segment_max_tf[term_id])
+            min_length[term_id] = min(min_length[term_id], segment_min_length[term_id])
+    write_term_stats(output_path, max_tf, min_length)
+
+    id_to_docno = {}
+    documents = DocumentStoreWriter(os.path.join(output_path, DOCUMENTS_FILENAME))
+    for path in paths:
+        docno_table = load_segment_docno_table(path)
+        store = DocumentStore(os.path.join(path, DOCUMENTS_FILENAME))
+        for local_id in range(1, len(store) + 1):
+            id_to_docno[len(id_to_docno) + 1] = docno_table.docno(local_id)
+            documents.add_record(len(id_to_docno), store.record(local_id))
+        store.close()
+    documents.close()
+    write_docno_table(output_path, id_to_docno)
+
+
+# Merge one run of segments chosen by the merge policy, returning False if there was none or another
+# merge holds the merge lock. That merge goes on until nothing is left to merge, though a segment
+# appended just as it finishes waits for the next append's merge. Only appends can change
+# segments.json meanwhile, and they only add segments at the end. The merged segment replaces the
+# old ones in segments.json in one step and the old directories are removed afterwards, so a reader
+# that read the old segments.json can fail to open them.
+def merge_once(index_path, merge_factor=DEFAULT_MERGE_FACTOR):
+    with merge_lock(index_path) as locked:
+        if not locked:
+            return False
+        window = choose_merge(read_segments(index_path) or [], merge_factor)
+        if window is None:
+            return False
+        first_id = window[0]['first_id']
+        documents = sum(segment['documents'] for segment in window)
+        name = f"seg-{first_id}-{first_id + documents - 1}"
+        # Left behind by an interrupted merge
+        output_path = os.path.join(index_path, SEGMENTS_DIRECTORY, f"merging-{name}")
+        if os.path.exists(output_path):
+            shutil.rmtree(output_path)
+        write_merged_segment(index_path, window, output_path)
+
+        with segments_lock(index_path):
+            segments = read_segments(index_path)
+            start = [segment['path'] for segment in segments].index(window[0]['path'])
+            os.rename(output_path, os.path.join(index_path, SEGMENTS_DIRECTORY, name))
+            merged = {'path': os.path.join(SEGMENTS_DIRECTORY, name), 'first_id': first_id, 'documents': documents}
+            write_segments(index_path, segments[:start] + [merged] + segments[start + len(window):])
+
+        for segment in window:
+            shutil.rmtree(segment_directory(index_path, segment))
+        return True
+
+
+def merge_segments(index_path, merge_factor=DEFAULT_MERGE_FACTOR):
+    while merge_once(index_path, merge_factor):
+        pass
+
+
+# Run the merge policy in a separate process that outlives the caller, logging to segments/merge.log
+def start_background_merge(index_path):
+    log_path = os.path.join(index_path, SEGMENTS_DIRECTORY, MERGE_LOG_FILENAME)
+    with open(log_path, 'a') as log:
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), index_path], stdout=log, stderr=subprocess.STDOUT,
+                         stdin=subprocess.DEVNULL, start_new_session=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Merge the small segments of an index that documents were appended to')
+    parser.add_argument('index_path', help='Path to the index directory')
+    parser.add_argument('--merge-factor', type=int, default=DEFAULT_MERGE_FACTOR, help='Number of segments of about the same size to merge into one')
+    args = parser.parse_args()
+
+    if read_segments(args.index_path) is None:
+        print("Error: the index has no appended segments to merge.")
+        sys.exit(1)
+    merge_segments(args.index_path, args.merge_factor)
@@ -0,0 +1,39 @@
+import os
+import json
+from bisect import bisect_right
+
+# An index that has had documents appended to it lists its segments in segments.json, in internal
+# id order: the index directory itself ("."), then one directory per appended batch under segments/.
+# Every segment has its own postings, doc-lengths.txt, docno table and document store covering the
+# internal ids first_id .. first_id + documents - 1, while the lexicon, collection statistics and
+# BM25 upper bounds in the index directory cover all of them. Indexes without segments.json are a
+# single segment.
+SEGMENTS_FILENAME = "segments.json"
+SEGMENTS_DIRECTORY = "segments"
+
+
+# Segments of an index as dicts with 'path' (relative to the index), 'first_id' and 'documents',
+# or None for a single-segment index
+def read_segments(index_path):
+    path = os.path.join(index_path, SEGMENTS_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)['segments']
+
+
+# Replace the segment list in one step, so readers see either the old or the new list
+def write_segments(index_path, segments):
+    path = os.path.join(index_path, SEGMENTS_FILENAME)
+    with open(path + ".tmp", 'w') as f:
+        json.dump({'segments': segments}, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def segment_directory(index_path, segment):
+    return os.path.normpath(os.path.join(index_path, segment['path']))
+
+
+# Position in segments of the segment holding an internal id
+def segment_of(first_ids, internal_id):
+    return bisect_right(first_ids, internal_id) - 1
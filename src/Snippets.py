@@ -0,0 +1,79 @@
+import re
+from array import array
+
+# A sentence ends at ., ! or ? (plus any closing quotes or brackets) followed by whitespace,
+# unless the word before it is a common abbreviation, a single initial or dotted like U.S.
+SENTENCE_END = re.compile(r'[.!?]+["\')\]]*(?=\s|$)')
+ABBREVIATIONS = {
+    'mr', 'mrs', 'ms', 'dr', 'st', 'jr', 'sr', 'inc', 'co', 'corp', 'ltd', 'gen', 'gov', 'sen', 'rep',
+    'lt', 'col', 'sgt', 'capt', 'rev', 'prof', 'vs', 'no', 'jan', 'feb', 'aug', 'sept', 'oct', 'nov', 'dec',
+}
+WORD = re.compile(r'\w+')
+METADATA_END_IDENTIFIER = "words"
+
+
+# Sentence boundaries of a text as a flat array of (start, end) character offsets
+def sentence_offsets(text):
+    offsets = array('I')
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        # Only the tail of the sentence so far is needed to find the word before the full stop
+        words = text[max(start, match.start() - 32):match.start()].split()
+        last_word = words[-1].lower().lstrip('"\'(') if words else ''
+        if match.group().startswith('.') and (last_word in ABBREVIATIONS or '.' in last_word or (len(last_word) == 1 and last_word.isalpha())):
+            continue
+        add_sentence(text, start, match.end(), offsets)
+        start = match.end()
+    add_sentence(text, start, len(text), offsets)
+    return offsets
+
+
+def add_sentence(text, start, end, offsets):
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    if start < end:
+        offsets.append(start)
+        offsets.append(end)
+
+
+# Pick the body sentence sharing the most distinct query terms with the query, preferring earlier
+# sentences. Sentences up to the one with the word count ("... words") are metadata and skipped,
+# as are upper case headings and sentences under four words. A single pass over the text's
+# words assigns each query term occurrence to its sentence, so this is linear in the document.
+def generate_snippet(text, offsets, query_terms):
+    num_sentences = len(offsets) // 2
+    matched_terms = [None] * num_sentences
+    sentence = 0
+    for match in WORD.finditer(text):
+        term = match.group().lower()
+        if term in query_terms:
+            while sentence < num_sentences and offsets[2 * sentence + 1] <= match.start():
+                sentence += 1
+            if sentence == num_sentences:
+                break
+            if offsets[2 * sentence] <= match.start():
+                if matched_terms[sentence] is None:
+                    matched_terms[sentence] = set()
+                matched_terms[sentence].add(term)
+
+    best_snippet = ""
+    best_score = float('-inf')
+    main_text_started = False
+
+    for i in range(num_sentences):
+        candidate = text[offsets[2 * i]:offsets[2 * i + 1]]
+        if METADATA_END_IDENTIFIER in candidate.lower():
+            main_text_started = True
+            continue
+
+        if not main_text_started or not matched_terms[i] or candidate.isupper() or len(candidate.split()) < 4:
+            continue
+
+        score = len(matched_terms[i]) - 0.1 * i
+        if score > best_score:
+            best_snippet = candidate
+            best_score = score
+
+    return best_snippet or "No relevant snippet found."
@@ -0,0 +1,33 @@
+from FastPorterStemmer import FastPorterStemmer
+
+# Distinct surface forms to remember. Tokens follow a Zipf distribution, so the forms seen
+# first cover almost all occurrences and later rare forms can simply be stemmed each time.
+DEFAULT_STEM_CACHE_SIZE = 500000
+
+
+# Memoizes Porter stems by surface form, for both indexing and query processing
+class StemCache:
+    def __init__(self, max_size=DEFAULT_STEM_CACHE_SIZE):
+        self.stemmer = FastPorterStemmer()
+        self.stems = {}
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def stem(self, token):
+        stem = self.stems.get(token)
+        if stem is not None:
+            self.hits += 1
+            return stem
+        self.misses += 1
+        stem = self.stemmer.stem(token, 0, len(token) - 1)
+        if len(self.stems) < self.max_size:
+            self.stems[token] = stem
+        return stem
+
+    def stem_tokens(self, tokens):
+        return [self.stem(token) for token in tokens]
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
@@ -0,0 +1,122 @@
+import os
+import heapq
+import struct
+from operator import attrgetter
+from array import array
+from PostingsFile import open_inverted_index, open_cursor, END_OF_POSTINGS
+from CollectionStats import load_collection_stats, DEFAULT_K1, DEFAULT_B
+
+UPPER_BOUNDS_FILENAME = "bm25_upper_bounds.bin"
+UPPER_BOUNDS_HEADER = struct.Struct('<4sdd')
+UPPER_BOUNDS_MAGIC = b'UBND'
+
+
+# Largest BM25 contribution any single document gets from each term
+def compute_upper_bounds(inverted_index, stats):
+    upper_bounds = array('d')
+
+    for term_id, term_postings in enumerate(inverted_index):
+        idf = stats.idf[term_id]
+        best = 0.0
+        for doc_id, term_freq in term_postings:
+            K = stats.K[doc_id - 1]
+            best = max(best, (term_freq / (K + term_freq)) * idf)
+        upper_bounds.append(best)
+
+    return upper_bounds
+
+
+def write_upper_bounds(index_path, upper_bounds, k1=DEFAULT_K1, b=DEFAULT_B):
+    path = os.path.join(index_path, UPPER_BOUNDS_FILENAME)
+    with open(path + ".tmp", 'wb') as f:
+        f.write(UPPER_BOUNDS_HEADER.pack(UPPER_BOUNDS_MAGIC, k1, b))
+        upper_bounds.tofile(f)
+    os.replace(path + ".tmp", path)
+
+
+# Compute and store the upper bounds of a freshly built index
+def build_upper_bounds(index_path, k1=DEFAULT_K1, b=DEFAULT_B):
+    inverted_index = open_inverted_index(index_path)
+    upper_bounds = compute_upper_bounds(inverted_index, load_collection_stats(index_path, k1, b))
+    write_upper_bounds(index_path, upper_bounds, k1, b)
+
+
+# Load the stored upper bounds, recomputing them if they are missing or were built for another k1 / b
+def load_upper_bounds(index_path, inverted_index, stats):
+    path = os.path.join(index_path, UPPER_BOUNDS_FILENAME)
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            magic, stored_k1, stored_b = UPPER_BOUNDS_HEADER.unpack(f.read(UPPER_BOUNDS_HEADER.size))
+            if magic == UPPER_BOUNDS_MAGIC and (stored_k1, stored_b) == (stats.k1, stats.b):
+                upper_bounds = array('d')
+                upper_bounds.frombytes(f.read())
+                return upper_bounds
+    return compute_upper_bounds(inverted_index, stats)
+
+
+class QueryTerm:
+    def __init__(self, cursor, idf, upper_bound):
+        self.cursor = cursor
+        self.idf = idf
+        self.upper_bound = upper_bound
+
+
+# Document-at-a-time BM25 with WAND pruning and a heap of the best k documents.
+# Scores are summed in query term order exactly like bm25_retrieval, so the top k
+# documents and their scores are the same; ties are ranked by internal id.
+def wand_retrieval(query, inverted_index, lexicon, stats, upper_bounds, k=1000):
+    terms = []
+    for term in query:
+        if term in lexicon:
+            term_id = lexicon[term]
+            # Negative contributions can only lower a score, so they never count towards a bound
+            terms.append(QueryTerm(open_cursor(inverted_index[term_id]), stats.idf[term_id], max(upper_bounds[term_id], 0.0)))
+
+    top_k = []  # min-heap of (score, -doc_id)
+    threshold = float('-inf')
+    by_doc_id = attrgetter('cursor.doc_id')
+    active = list(terms)
+
+    while active:
+        # Exhausted cursors sort last
+        active.sort(key=by_doc_id)
+        while active and active[-1].cursor.doc_id == END_OF_POSTINGS:
+            active.pop()
+        if not active:
+            break
+
+        # Pivot is the first term at which the summed upper bounds could beat the current top k
+        pivot = None
+        bound = 0.0
+        for i, query_term in enumerate(active):
+            bound += query_term.upper_bound
+            if bound > threshold:
+                pivot = i
+                break
+        if pivot is None:
+            break
+        pivot_doc = active[pivot].cursor.doc_id
+
+        if active[0].cursor.doc_id == pivot_doc:
+            # Every term up to the pivot is on pivot_doc, so score it fully
+            K = stats.K[pivot_doc - 1]
+            score = 0.0
+            for query_term in terms:
+                cursor = query_term.cursor
+                if cursor.doc_id == pivot_doc:
+                    term_freq = cursor.term_frequency()
+                    score += (term_freq / (K + term_freq)) * query_term.idf
+                    cursor.next()
+
+            if len(top_k) < k:
+                heapq.heappush(top_k, (score, -pivot_doc))
+            elif score > top_k[0][0]:
+                heapq.heapreplace(top_k, (score, -pivot_doc))
+            if len(top_k) == k:
+                threshold = top_k[0][0]
+        else:
+            # No document before pivot_doc can make the top k, so skip the preceding terms to it
+            for query_term in active[:pivot]:
+                query_term.cursor.seek(pivot_doc)
+
+    return [(-neg_doc_id, score) for score, neg_doc_id in sorted(top_k, reverse=True)]
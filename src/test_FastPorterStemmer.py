@@ -0,0 +1,82 @@
+import unittest
+from PorterStemmer import PorterStemmer
+from FastPorterStemmer import FastPorterStemmer
+
+# Words and their stems, grouped by the step of the algorithm they exercise
+STEMS = {
+    'step 1a': [
+        ('caresses', 'caress'), ('ponies', 'poni'), ('ties', 'ti'), ('caress', 'caress'), ('cats', 'cat'),
+    ],
+    'step 1b': [
+        ('feed', 'feed'), ('agreed', 'agre'), ('plastered', 'plaster'), ('bled', 'bled'), ('motoring', 'motor'),
+        ('sing', 'sing'), ('conflated', 'conflat'), ('troubled', 'troubl'), ('sized', 'size'), ('hopping', 'hop'),
+        ('tanned', 'tan'), ('falling', 'fall'), ('hissing', 'hiss'), ('fizzed', 'fizz'), ('failing', 'fail'),
+        ('filing', 'file'),
+    ],
+    'step 1c': [
+        ('happy', 'happi'), ('sky', 'sky'),
+    ],
+    'step 2': [
+        ('relational', 'relat'), ('conditional', 'condit'), ('rational', 'ration'), ('valenci', 'valenc'),
+        ('hesitanci', 'hesit'), ('digitizer', 'digit'), ('radicalli', 'radic'), ('differentli', 'differ'),
+        ('vileli', 'vile'), ('analogousli', 'analog'), ('vietnamization', 'vietnam'), ('predication', 'predic'),
+        ('operator', 'oper'), ('feudalism', 'feudal'), ('decisiveness', 'decis'), ('hopefulness', 'hope'),
+        ('callousness', 'callous'), ('formaliti', 'formal'), ('sensitiviti', 'sensit'), ('sensibiliti', 'sensibl'),
+    ],
+    'step 3': [
+        ('triplicate', 'triplic'), ('formative', 'form'), ('formalize', 'formal'), ('electriciti', 'electr'),
+        ('electrical', 'electr'), ('hopeful', 'hope'), ('goodness', 'good'),
+    ],
+    'step 4': [
+        ('revival', 'reviv'), ('allowance', 'allow'), ('inference', 'infer'), ('airliner', 'airlin'),
+        ('gyroscopic', 'gyroscop'), ('adjustable', 'adjust'), ('defensible', 'defens'), ('irritant', 'irrit'),
+        ('replacement', 'replac'), ('adjustment', 'adjust'), ('dependent', 'depend'), ('adoption', 'adopt'),
+        ('homologou', 'homolog'), ('communism', 'commun'), ('activate', 'activ'), ('angulariti', 'angular'),
+        ('homologous', 'homolog'), ('effective', 'effect'), ('bowdlerize', 'bowdler'),
+    ],
+    'step 5': [
+        ('probate', 'probat'), ('rate', 'rate'), ('cease', 'ceas'), ('controll', 'control'), ('roll', 'roll'),
+    ],
+    # Words of one or two letters are left alone, -bli becomes -ble and -logi becomes -log
+    'departures': [
+        ('a', 'a'), ('is', 'is'), ('as', 'as'), ('conformabli', 'conform'), ('visibli', 'visibl'),
+        ('archaeologi', 'archaeolog'), ('analogi', 'analog'),
+    ],
+    # y is a consonant at the start of a word or after a vowel, and a vowel otherwise
+    'y': [
+        ('yellow', 'yellow'), ('toy', 'toi'), ('crying', 'cry'), ('saying', 'sai'), ('enjoy', 'enjoi'),
+        ('mayor', 'mayor'), ('eyes', 'ey'), ('yearly', 'yearli'), ('boyish', 'boyish'), ('syzygy', 'syzygi'),
+    ],
+    'non-ASCII': [
+        ('naïvely', 'naïv'), ('café', 'café'),
+    ],
+}
+
+
+class FastPorterStemmerTest(unittest.TestCase):
+    def test_stems(self):
+        stemmer = FastPorterStemmer()
+        for group, pairs in STEMS.items():
+            for word, stem in pairs:
+                with self.subTest(group=group, word=word):
+                    self.assertEqual(stemmer.stem(word), stem)
+
+    def test_matches_porter_stemmer(self):
+        reference = PorterStemmer()
+        for group, pairs in STEMS.items():
+            for word, stem in pairs:
+                with self.subTest(group=group, word=word):
+                    self.assertEqual(reference.stem(word, 0, len(word) - 1), stem)
+
+    def test_stem_many(self):
+        words = [word for pairs in STEMS.values() for word, _ in pairs]
+        stems = [stem for pairs in STEMS.values() for _, stem in pairs]
+        self.assertEqual(FastPorterStemmer().stem_many(words), stems)
+
+    # Only p[i] .. p[j] is stemmed, as with PorterStemmer
+    def test_stem_range(self):
+        self.assertEqual(FastPorterStemmer().stem('xxponiesxx', 2, 7), 'poni')
+
+
+if __name__ == '__main__':
+    unittest.main()
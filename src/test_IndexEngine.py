@@ -0,0 +1,89 @@
+import os
+import sys
+import gzip
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+from DocnoTable import load_docno_table
+from PostingsFile import open_inverted_index
+from ParallelIndexer import DEFAULT_CHUNK_SIZE
+from Segments import read_segments, SEGMENTS_DIRECTORY
+
+INDEX_ENGINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "IndexEngine.py")
+WORDS = ['sun', 'damage', 'eyes', 'police', 'wine', 'ozone', 'light', 'children', 'enemy', 'quoted']
+
+
+# A small collection of documents numbered from first to first + count - 1, in the LA Times format
+def write_collection(path, first, count):
+    with gzip.open(path, 'wt') as f:
+        for n in range(first, first + count):
+            words = ' '.join(WORDS[(n * i) % len(WORDS)] for i in range(1, 8))
+            f.write(f"<DOC>\n<DOCNO> LA0101{n // 10000 % 100:02d}-{n % 10000:04d} </DOCNO>\n"
+                    f"<HEADLINE>\n<P>\nHeadline {n}\n</P>\n</HEADLINE>\n"
+                    f"<TEXT>\n<P>\n{words} w{n}.\n</P>\n</TEXT>\n</DOC>\n")
+
+
+def index_engine(*args):
+    return subprocess.run([sys.executable, INDEX_ENGINE, *args], capture_output=True, text=True)
+
+
+class AppendTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.base = os.path.join(self.directory, "base.gz")
+        self.batch = os.path.join(self.directory, "batch.gz")
+        self.everything = os.path.join(self.directory, "all.gz")
+        # The appended batch spans more than one chunk of the parallel indexer
+        batch_size = DEFAULT_CHUNK_SIZE + DEFAULT_CHUNK_SIZE // 2
+        write_collection(self.base, 1, 300)
+        write_collection(self.batch, 301, batch_size)
+        write_collection(self.everything, 1, 300 + batch_size)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def build(self, *args):
+        result = index_engine(*args)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+
+    def test_parallel_append_matches_full_build(self):
+        full = os.path.join(self.directory, "full")
+        appended = os.path.join(self.directory, "appended")
+        self.build(self.everything, full, "--workers", "2")
+        self.build(self.base, appended)
+        self.build(self.batch, appended, "--append", "--workers", "2")
+
+        segments = read_segments(appended)
+        self.assertEqual([(segment['first_id'], segment['documents']) for segment in segments],
+                         [(1, 300), (301, DEFAULT_CHUNK_SIZE + DEFAULT_CHUNK_SIZE // 2)])
+        self.assertNotIn("new-301", os.listdir(os.path.join(appended, SEGMENTS_DIRECTORY)))
+
+        expected = load_docno_table(full)
+        actual = load_docno_table(appended)
+        self.assertEqual(len(actual), len(expected))
+        for internal_id in range(1, len(expected) + 1):
+            self.assertEqual(actual.docno(internal_id), expected.docno(internal_id))
+
+        with open(os.path.join(full, "Lexicon", "lexicon_term_to_id.json")) as f:
+            lexicon = json.load(f)
+        expected_postings = open_inverted_index(full)
+        actual_postings = open_inverted_index(appended)
+        for term, term_id in lexicon.items():
+            self.assertEqual(list(actual_postings[term_id]), list(expected_postings[term_id]), term)
+
+    # A failed append leaves no staging directory behind, so the next one can run
+    def test_failed_append_is_cleaned_up(self):
+        index = os.path.join(self.directory, "index")
+        self.build(self.base, index)
+        result = index_engine(os.path.join(self.directory, "missing.gz"), index, "--append", "--workers", "2")
+        self.assertNotEqual(result.returncode, 0)
+        self.assertEqual(os.listdir(os.path.join(index, SEGMENTS_DIRECTORY)), [])
+
+        self.build(self.batch, index, "--append", "--workers", "2")
+        self.assertEqual(len(load_docno_table(index)), 300 + DEFAULT_CHUNK_SIZE + DEFAULT_CHUNK_SIZE // 2)
+
+
+if __name__ == '__main__':
+    unittest.main()